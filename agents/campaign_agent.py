@@ -1,6 +1,7 @@
 from typing import Dict, Any, List
 import json
 from utils.llm_utils import ask_ollama
+from utils.http_client import SHARED_OLLAMA_CLIENT
 
 
 class CampaignAgent:
@@ -17,8 +18,9 @@ class CampaignAgent:
     if the model does not return the expected schema.
     """
 
-    def __init__(self, ollama_model: str = "mistral:7b"):
+    def __init__(self, ollama_model: str = "mistral:7b", llm_client=None):
         self.ollama_model = ollama_model
+        self.llm_client = llm_client or SHARED_OLLAMA_CLIENT
 
     def analyze_campaigns(self, user_prompt: str = "") -> Dict[str, Any]:
         """
@@ -45,9 +47,10 @@ Output STRICT JSON with top-level keys:
 Return ONLY valid JSON following the schema. No markdown or extra text.
 """
 
-        prompt = f"{system_prompt}\n\nCampaign data / user question:\n{user_prompt}"
+        prompt = f"Campaign data / user question:\n{user_prompt}"
 
-        resp = ask_ollama(prompt, model=self.ollama_model, json_mode=True)
+        resp = ask_ollama(prompt, model=self.ollama_model, json_mode=True, client=self.llm_client,
+                          max_output_tokens=400, system=system_prompt)
 
         # Init
         insights: List[Dict[str, Any]] = []
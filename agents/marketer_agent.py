@@ -3,11 +3,13 @@ from typing import Dict, Any, List
 import json
 import ollama
 from utils.llm_utils import ask_ollama
+from utils.http_client import SHARED_OLLAMA_CLIENT
 
 
 class MarketerAgent:
-    def __init__(self, ollama_model: str = "mistral:7b"):
+    def __init__(self, ollama_model: str = "mistral:7b", llm_client=None):
         self.ollama_model = ollama_model
+        self.llm_client = llm_client or SHARED_OLLAMA_CLIENT
 
     def _ensure_list_of_str(self, v):
         if v is None:
@@ -203,8 +205,6 @@ If you cannot produce a confident answer, still return valid JSON, and set sensi
         }
 
         prompt = f"""
-{system_prompt}
-
 Agent Insights (JSON):
 {json.dumps(insights_blob, default=str, indent=2)}
 
@@ -215,7 +215,9 @@ Task:
 """
 
         # Ask the LLM via helper
-        resp = ask_ollama(prompt, model=self.ollama_model, json_mode=True)
+        # the full strategy object needs more room than the default JSON budget
+        resp = ask_ollama(prompt, model=self.ollama_model, json_mode=True, client=self.llm_client,
+                          max_output_tokens=400, system=system_prompt)
 
         # If response is already a dict, use it; else attempt to parse JSON; else fallback to structured content
         result: Dict[str, Any]
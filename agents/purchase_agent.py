@@ -2,11 +2,13 @@
 from typing import Dict, Any
 import json
 from utils.llm_utils import ask_ollama
+from utils.http_client import SHARED_OLLAMA_CLIENT
 
 
 class PurchaseAgent:
-    def __init__(self, ollama_model="mistral:7b"):
+    def __init__(self, ollama_model="mistral:7b", llm_client=None):
         self.ollama_model = ollama_model
+        self.llm_client = llm_client or SHARED_OLLAMA_CLIENT
 
     def analyze_purchases(self, user_prompt: str) -> Dict[str, Any]:
         """
@@ -47,9 +49,12 @@ class PurchaseAgent:
 
         # Call LLM
         resp = ask_ollama(
-            f"{system_prompt}\n\nUser question:\n{user_prompt}",
+            f"User question:\n{user_prompt}",
             model=self.ollama_model,
-            json_mode=True
+            json_mode=True,
+            client=self.llm_client,
+            max_output_tokens=400,
+            system=system_prompt,
         )
 
         # Normalize output
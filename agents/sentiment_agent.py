@@ -1,8 +1,8 @@
 from typing import Dict, Any, List
 import json
 import chromadb
-import ollama
 from utils.llm_utils import ask_ollama
+from utils.http_client import SHARED_OLLAMA_CLIENT
 
 
 class SentimentAgent:
@@ -27,9 +27,10 @@ class SentimentAgent:
       "confidence": 0.0
     }
     """
-    def __init__(self, chroma_dir: str = "./chroma_db", ollama_model: str = "mistral:7b", top_k: int = 10):
+    def __init__(self, chroma_dir: str = "./chroma_db", ollama_model: str = "mistral:7b", top_k: int = 10, llm_client=None):
         self.ollama_model = ollama_model
         self.top_k = top_k
+        self.llm_client = llm_client or SHARED_OLLAMA_CLIENT
 
         # Try to connect to ChromaDB; if not available, keep None and continue (graceful degrade)
         try:
@@ -58,7 +59,7 @@ class SentimentAgent:
         try:
             # Prefer generating an embedding via ollama if available
             try:
-                emb = ollama.embeddings(model="nomic-embed-text", prompt=query).embedding
+                emb = self.llm_client.embeddings(model="nomic-embed-text", prompt=query).embedding
             except Exception:
                 emb = None
 
@@ -123,10 +124,11 @@ Example:
 {json.dumps(schema_example, ensure_ascii=False, indent=2)}
 """
 
-        prompt = f"{system_prompt}\n\nCustomer Sentiment Data:\n{sentiment_docs}\n\nUser question: {user_prompt}"
+        prompt = f"Customer Sentiment Data:\n{sentiment_docs}\n\nUser question: {user_prompt}"
 
         # Ask the LLM and expect JSON back (ask_ollama handles json_mode=True)
-        resp = ask_ollama(prompt, model=self.ollama_model, json_mode=True)
+        resp = ask_ollama(prompt, model=self.ollama_model, json_mode=True, client=self.llm_client,
+                          max_output_tokens=400, system=system_prompt)
 
         # Initialize outputs
         insights: List[Dict[str, Any]] = []
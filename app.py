@@ -5,12 +5,24 @@ Main application for the multi-agent marketing system with refreshed UI.
 
 import streamlit as st
 import json
+import io
+import orjson
 import pandas as pd
-from orchestrator import run_flow
+from orchestrator import run_flow, warmup_models
 import os
 import time
+import threading
 import traceback
 
+@st.cache_resource(show_spinner=False)  # must not emit an element before set_page_config
+def start_model_warmup():
+    """Warm the agents' Ollama models once per server process, without blocking the page"""
+    t = threading.Thread(target=warmup_models, daemon=True)
+    t.start()
+    return t
+
+start_model_warmup()
+
 # Initialize session state for conversation memory
 if 'conversation_history' not in st.session_state:
     st.session_state.conversation_history = []
@@ -40,6 +52,19 @@ def parse_agent_response(response_text):
             return {"summary": response_text}
     return response_text
 
+def preview(obj, max_chars=4000):
+    """Serialize obj as indented JSON, keeping only the first max_chars characters"""
+    s = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS, default=str).decode()
+    if len(s) <= max_chars:
+        return s
+    return s[:max_chars] + f"\n... ({len(s) - max_chars} more chars)"
+
+@st.cache_data(show_spinner=False)
+def csv_preview(data: bytes, n=5):
+    """Parse an uploaded CSV once per file content, returning (row count, first n rows)"""
+    df = pd.read_csv(io.BytesIO(data))
+    return len(df), df.head(n)
+
 def truncate_text(text, max_length=300):
     """Truncate text at word boundaries to avoid cutting words in half"""
     text = str(text)
@@ -324,9 +349,10 @@ with st.sidebar:
         
         # Process the file (you can add RAG processing here)
         if uploaded_file.type == "text/csv":
-            df = pd.read_csv(uploaded_file)
-            st.write(f"📈 Data Preview ({len(df)} rows):")
-            st.dataframe(df.head(), use_container_width=True)
+            n_rows, head = csv_preview(uploaded_file.getvalue())
+            st.write(f"📈 Data Preview ({n_rows} rows):")
+            if not head.empty:
+                st.dataframe(head, use_container_width=True)
     
     st.markdown("---")
     
@@ -749,7 +775,7 @@ if analyze_btn and user_input:
             
             # Show raw JSON for debugging
             with st.expander("🔧 Raw Results (Debug)"):
-                st.json(result)
+                st.code(preview(result), language="json")
                 
         except Exception as e:
             # This outer except ensures any unexpected UI errors are caught and shown
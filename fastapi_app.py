@@ -2,24 +2,30 @@
 import os
 import time
 import json
+import orjson
+import hashlib
 import logging
 import subprocess
-from typing import Dict, Any, Optional
+import threading
+from typing import Dict, Any, Optional, List
 from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import yaml
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from starlette.middleware.cors import CORSMiddleware
 from jsonschema import validate, ValidationError
+from utils.llm_utils import _first_balanced_object
 
 # import orchestrator build function defensively so module import doesn't crash the whole app
 try:
-    from orchestrator import build_graph
+    from orchestrator import build_graph, warmup_models
 except Exception as e:
     # log the import failure and allow the rest of the app to start.
     logging.exception("Could not import orchestrator.build_graph at module import: %s", e)
     build_graph = None
+    warmup_models = None
 
 # load config
 CFG_PATH = os.environ.get("MG_CONFIG", "./configs/prompts.yaml")
@@ -48,6 +54,12 @@ except Exception as e:
     logger.exception("Failed to build workflow: %s", e)
     workflow_app = None
 
+@app.on_event("startup")
+def warm_models():
+    # load agent models in the background so the first /strategy call doesn't pay for it
+    if warmup_models is not None:
+        threading.Thread(target=warmup_models, daemon=True).start()
+
 def record(endpoint: str, t0: float):
     REQ_COUNTER.labels(endpoint=endpoint, method="POST").inc()
     REQ_LATENCY.labels(endpoint=endpoint).observe(time.time() - t0)
@@ -65,10 +77,53 @@ def run_ingest_subproc(campaign, purchase, sentiment, pdf, persist_dir, batch_si
     cmd = ["python", "ingest.py", "--campaign", campaign, "--purchase", purchase, "--sentiment", sentiment, "--pdf", pdf, "--persist-dir", persist_dir, "--batch-size", str(batch_size)]
     subprocess.Popen(cmd)
 
+# raw_state fields the UI renders; resp_hash covers exactly these
+DISPLAY_STATE_KEYS = ("route", "agent_outputs", "final_decision", "campaign_output", "purchase_output")
+
+def build_strategy_response(final_state: Any, thread_id: Optional[str]) -> Dict[str, Any]:
+    # Ensure final_state is a dict
+    if not isinstance(final_state, dict):
+        final_state = {"result": final_state}
+
+    final_strategy = final_state.get("final_decision")
+    # validation / deterministic enforcement
+    valid = True
+    schema_err = None
+    try:
+        validate(instance=final_strategy, schema=FINAL_STRATEGY_SCHEMA)
+    except ValidationError as e:
+        valid = False
+        schema_err = str(e)
+        # attempt to salvage: if strategy is string, try extract json
+        if isinstance(final_strategy, str):
+            candidate = _first_balanced_object(final_strategy)
+            if candidate:
+                try:
+                    final_strategy = json.loads(candidate)
+                    validate(instance=final_strategy, schema=FINAL_STRATEGY_SCHEMA)
+                    valid = True
+                    schema_err = None
+                except Exception:
+                    pass
+    response = {"final_strategy": final_strategy, "valid_schema": valid, "schema_error": schema_err}
+    # include raw per-agent outputs for UI trace
+    response["raw_state"] = final_state
+    # content hash so clients can skip replacing (and re-deriving from) an identical raw_state.
+    # Only the displayed fields count: messages grow every turn and would make every hash unique.
+    shown = {k: final_state.get(k) for k in DISPLAY_STATE_KEYS}
+    raw_blob = orjson.dumps(shown, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    response["resp_hash"] = hashlib.blake2b(raw_blob, digest_size=8).hexdigest()
+    # include thread id so UI can persist it for conversational memory
+    response["thread_id"] = thread_id
+    return response
+
 class StrategyRequest(BaseModel):
     query: str
     thread_id: Optional[str] = None
 
+class BatchStrategyRequest(BaseModel):
+    items: List[StrategyRequest]
+
 @app.get("/health")
 async def health():
     return {"status": "ok", "workflow_loaded": workflow_app is not None}
@@ -128,7 +183,7 @@ async def strategy(req: StrategyRequest):
     if final_state is None:
         try:
             # Pass thread_id inside payload so orchestrator nodes can access it if they want
-            payload = {"user_prompt": req.query, "thread_id": req.thread_id}
+            payload = {"user_prompt": req.query, "thread_id": req.thread_id, "agent_outputs": []}
 
             # --- Minimal change: supply LangGraph checkpointer `config` with thread_id ---
             config = {"configurable": {"thread_id": req.thread_id}}
@@ -147,39 +202,70 @@ async def strategy(req: StrategyRequest):
             logger.exception("Workflow invoke failed")
             raise HTTPException(status_code=500, detail=str(e))
 
-    # Ensure final_state is a dict
-    if not isinstance(final_state, dict):
-        final_state = {"result": final_state}
-
-    final_strategy = final_state.get("final_decision")
-    # validation / deterministic enforcement
-    valid = True
-    schema_err = None
-    try:
-        validate(instance=final_strategy, schema=FINAL_STRATEGY_SCHEMA)
-    except ValidationError as e:
-        valid = False
-        schema_err = str(e)
-        # attempt to salvage: if strategy is string, try extract json
-        if isinstance(final_strategy, str):
-            s = final_strategy
-            start = s.find("{"); end = s.rfind("}")
-            if start != -1 and end != -1:
-                try:
-                    final_strategy = json.loads(s[start:end+1])
-                    validate(instance=final_strategy, schema=FINAL_STRATEGY_SCHEMA)
-                    valid = True
-                    schema_err = None
-                except Exception:
-                    pass
+    response = build_strategy_response(final_state, thread_id)
     record("/strategy", start)
-    response = {"final_strategy": final_strategy, "valid_schema": valid, "schema_error": schema_err}
-    # include raw per-agent outputs for UI trace
-    response["raw_state"] = final_state
-    # include thread id so UI can persist it for conversational memory
-    response["thread_id"] = thread_id
     return response
 
+def _sse(payload: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload, default=str)}\n\n"
+
+@app.post("/strategy/stream")
+def strategy_stream(req: StrategyRequest):
+    """
+    Same result as /strategy, delivered as server-sent events: one "node" event as
+    each agent finishes, then a "final" event carrying the full /strategy response.
+    """
+    start = time.time()
+    ok, reason = enforce_safety(req.query)
+    if not ok:
+        raise HTTPException(status_code=400, detail=reason)
+    if workflow_app is None:
+        raise HTTPException(status_code=500, detail="workflow not available")
+
+    from langgraph_integration import manager as graph_manager
+
+    def events():
+        final_state: Dict[str, Any] = {}
+        try:
+            for kind, payload in graph_manager.stream(req.thread_id, req.query):
+                if kind == "final":
+                    final_state = payload
+                else:
+                    yield _sse({"event": kind, **payload})
+        except Exception as e:
+            logger.exception("Streaming workflow invoke failed")
+            yield _sse({"event": "error", "detail": str(e)})
+            return
+        response = build_strategy_response(final_state, final_state.get("_thread_id"))
+        record("/strategy/stream", start)
+        yield _sse({"event": "final", "response": response})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/invoke_batch")
+async def invoke_batch(req: BatchStrategyRequest):
+    """Run several /strategy queries through a single graph.batch() call."""
+    start = time.time()
+    for item in req.items:
+        ok, reason = enforce_safety(item.query)
+        if not ok:
+            raise HTTPException(status_code=400, detail=reason)
+    if workflow_app is None:
+        raise HTTPException(status_code=500, detail="workflow not available")
+
+    try:
+        from langgraph_integration import manager as graph_manager
+        final_states = await run_in_threadpool(
+            graph_manager.batch_invoke, [(item.thread_id, item.query) for item in req.items]
+        )
+    except Exception as e:
+        logger.exception("Batch workflow invoke failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    responses = [build_strategy_response(fs, fs.get("_thread_id")) for fs in final_states]
+    record("/invoke_batch", start)
+    return {"results": responses}
+
 @app.get("/")
 async def root():
     return {"app":"nextgen-marketer"}
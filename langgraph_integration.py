@@ -5,12 +5,15 @@
 
 #It returns _thread_id so the API / front-end can persist the thread id in the session.
 # langgraph_integration.py
+import os
 import uuid
+import inspect
 import logging
-from typing import Optional, Any, Dict
+import threading
+from typing import Optional, Any, Dict, List, Tuple, Iterator
 
 logger = logging.getLogger("langgraph_integration")
-logger.setLevel(logging.INFO)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
 if not logger.handlers:
     ch = logging.StreamHandler()
     ch.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
@@ -24,13 +27,26 @@ except Exception as e:
     logger.warning("Could not import orchestrator.build_graph at import-time: %s", e)
     build_orchestrator_graph = None
 
+def _accepts_config(fn) -> bool:
+    """Return True if fn can be called with a `config=` keyword argument."""
+    try:
+        params = inspect.signature(fn).parameters
+    except (TypeError, ValueError):
+        return False
+    return "config" in params or any(p.kind is inspect.Parameter.VAR_KEYWORD for p in params.values())
+
+
 class GraphManager:
     def __init__(self):
         self.graph = None
+        self._invoker = None
+        self._lock = threading.Lock()
         # Try eager load (best-effort), but keep it resilient
         if build_orchestrator_graph is not None:
             try:
-                self.graph = build_orchestrator_graph()
+                graph = build_orchestrator_graph()
+                self._bind_invoker(graph)
+                self.graph = graph
                 logger.info("Orchestrator graph loaded into GraphManager at init.")
             except Exception as e:
                 logger.exception("Failed to build orchestrator graph at init: %s", e)
@@ -41,12 +57,37 @@ class GraphManager:
     def new_thread(self) -> str:
         return str(uuid.uuid4())
 
+    def _bind_invoker(self, graph):
+        """
+        Probe the compiled graph once and cache a (state, config) -> result callable,
+        so invoke() doesn't have to discover the call shape via TypeError on every request.
+        """
+        if hasattr(graph, "invoke"):
+            entry = graph.invoke
+        elif hasattr(graph, "run"):
+            entry = graph.run
+        else:
+            entry = graph
+
+        if _accepts_config(entry):
+            self._invoker = lambda s, c: entry(s, config=c)
+        else:
+            self._invoker = lambda s, c: entry(s)
+
     def ensure_graph(self):
-        if self.graph is None:
-            if build_orchestrator_graph is None:
-                raise RuntimeError("No orchestrator.build_graph available to construct a graph.")
+        if self.graph is not None:
+            return
+        if build_orchestrator_graph is None:
+            raise RuntimeError("No orchestrator.build_graph available to construct a graph.")
+        # double-checked so concurrent first requests build (and checkpoint into) one graph
+        with self._lock:
+            if self.graph is not None:
+                return
             try:
-                self.graph = build_orchestrator_graph()
+                graph = build_orchestrator_graph()
+                # bind before publishing self.graph so lock-free readers never see a graph without an invoker
+                self._bind_invoker(graph)
+                self.graph = graph
                 logger.info("Orchestrator graph lazy-loaded.")
             except Exception as e:
                 logger.exception("Failed to lazy-load orchestrator graph: %s", e)
@@ -68,6 +109,7 @@ class GraphManager:
         state = {
             "user_prompt": user_prompt,
             "thread_id": thread_id,
+            "agent_outputs": [],
         }
 
         if self.graph is None:
@@ -78,24 +120,7 @@ class GraphManager:
         config = {"configurable": {"thread_id": thread_id}}
 
         try:
-            # Try invoking with config first (required by graphs compiled with checkpointers)
-            if hasattr(self.graph, "invoke"):
-                try:
-                    result = self.graph.invoke(state, config=config)
-                except TypeError:
-                    # fallback if compiled graph.invoke doesn't accept config arg
-                    result = self.graph.invoke(state)
-            elif hasattr(self.graph, "run"):
-                try:
-                    result = self.graph.run(state, config=config)
-                except TypeError:
-                    result = self.graph.run(state)
-            else:
-                # If compiled graph is callable and may accept config
-                try:
-                    result = self.graph(state, config=config)
-                except TypeError:
-                    result = self.graph(state)
+            result = self._invoker(state, config)
         except Exception as e:
             logger.exception("Graph invocation raised an exception: %s", e)
             return {"error": "invoke_failed", "exception": str(e), "_thread_id": thread_id}
@@ -106,5 +131,87 @@ class GraphManager:
         result["_thread_id"] = thread_id
         return result
 
+    def stream(self, thread_id: Optional[str], user_prompt: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Like invoke(), but yields ("node", {...}) as each graph node finishes and then
+        ("final", state) with the same shape invoke() returns. Graphs without a
+        stream() method just yield the final state.
+        """
+        if thread_id is None:
+            thread_id = self.new_thread()
+
+        self.ensure_graph()
+
+        if not hasattr(self.graph, "stream"):
+            yield "final", self.invoke(thread_id, user_prompt)
+            return
+
+        state = {
+            "user_prompt": user_prompt,
+            "thread_id": thread_id,
+            "agent_outputs": [],
+        }
+        config = {"configurable": {"thread_id": thread_id}}
+
+        result: Dict[str, Any] = {}
+        for mode, chunk in self.graph.stream(state, config=config, stream_mode=["updates", "values"]):
+            if mode == "values":
+                result = chunk
+                continue
+            for node, update in (chunk or {}).items():
+                update = update or {}
+                event = {"node": node}
+                if "route" in update:
+                    event["route"] = update["route"]
+                outs = update.get("agent_outputs") or []
+                if outs:
+                    event["summary"] = outs[-1].get("summary")
+                yield "node", event
+
+        result = dict(result)
+        result["_thread_id"] = thread_id
+        yield "final", result
+
+    def batch_invoke(self, items: List[Tuple[Optional[str], str]]) -> List[Dict[str, Any]]:
+        """
+        Invoke the compiled graph for many (thread_id, user_prompt) pairs in one call.
+        Uses graph.batch() when available so LangGraph schedules the runs concurrently;
+        falls back to sequential invoke() otherwise. Results keep the input order and
+        each includes '_thread_id'.
+        """
+        thread_ids = [tid or self.new_thread() for tid, _ in items]
+
+        self.ensure_graph()
+
+        if self.graph is None:
+            logger.error("Graph is not available to invoke.")
+            return [{"error": "graph_not_available", "_thread_id": tid} for tid in thread_ids]
+
+        if not hasattr(self.graph, "batch"):
+            return [self.invoke(tid, prompt) for tid, (_, prompt) in zip(thread_ids, items)]
+
+        states = [
+            {"user_prompt": prompt, "thread_id": tid, "agent_outputs": []}
+            for tid, (_, prompt) in zip(thread_ids, items)
+        ]
+        configs = [{"configurable": {"thread_id": tid}} for tid in thread_ids]
+
+        try:
+            results = self.graph.batch(states, config=configs, return_exceptions=True)
+        except Exception as e:
+            logger.exception("Graph batch invocation raised an exception: %s", e)
+            return [{"error": "invoke_failed", "exception": str(e), "_thread_id": tid} for tid in thread_ids]
+
+        out = []
+        for tid, result in zip(thread_ids, results):
+            if isinstance(result, Exception):
+                logger.error("Graph batch item failed for thread %s: %s", tid, result)
+                result = {"error": "invoke_failed", "exception": str(result)}
+            elif not isinstance(result, dict):
+                result = {"result": result}
+            result["_thread_id"] = tid
+            out.append(result)
+        return out
+
 # Export a singleton manager for easy imports (e.g., `from langgraph_integration import manager`)
 manager = GraphManager()
@@ -1,12 +1,26 @@
-from typing import TypedDict, List, Dict, Any
+from typing import TypedDict, List, Dict, Any, Tuple, Annotated
 from langgraph.graph import StateGraph, END
+import os
+import re
+import logging
+import operator
 import uuid
+from functools import lru_cache
 from typing import Optional
 
 from agents.sentiment_agent import SentimentAgent
 from agents.purchase_agent import PurchaseAgent
 from agents.campaign_agent import CampaignAgent
 from agents.marketer_agent import MarketerAgent
+from utils.http_client import SHARED_OLLAMA_CLIENT
+from utils.llm_utils import warmup_model
+
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    ch.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(ch)
 
 
 # -------- State --------
@@ -15,9 +29,53 @@ class AgentState(TypedDict, total=False):
     route: List[str]          # list of agents to run in order
     agent_outputs: List[Dict[str, Any]]
     final_decision: Dict[str, Any]
+    # append-only: nodes return just their new messages and the reducer concatenates
+    messages: Annotated[List[Dict[str, Any]], operator.add]
+
+
+# -------- Agents --------
+@lru_cache(maxsize=None)
+def _get_agent(agent_cls):
+    """One agent instance per class, all sharing the process-wide Ollama client."""
+    return agent_cls(llm_client=SHARED_OLLAMA_CLIENT)
+
+
+def warmup_models() -> None:
+    """Load each agent's Ollama model ahead of the first request (blocking)."""
+    agent_classes = (SentimentAgent, PurchaseAgent, CampaignAgent, MarketerAgent)
+    for model in sorted({_get_agent(cls).ollama_model for cls in agent_classes}):
+        warmup_model(model)
 
 
 # -------- Router --------
+# Keywords are matched as word prefixes, so inflections ("purchased", "promotional",
+# "reviewed") route like their stems. Very short keywords are whole-word only so
+# that e.g. "ad" doesn't fire inside "add" or "made".
+def _keyword_re(prefixes, words=()):
+    alts = [rf"\b(?:{'|'.join(prefixes)})"]
+    if words:
+        alts.append(rf"\b(?:{'|'.join(words)})\b")
+    return re.compile("|".join(alts))
+
+SENTIMENT_RE = _keyword_re([
+    "sentiment", "feel", "felt", "emotion", "mood", "perception", "satisf", "buzz", "review",
+])
+PURCHASE_RE = _keyword_re([
+    "purchas", "buy", "bought", "sales", "transaction", "revenue", "order", "acquisition",
+    "spend", "spent", "sold",
+])
+CAMPAIGN_RE = _keyword_re([
+    "campaign", "advert", "marketing", "click", "impression", "reach", "promot",
+    "performance", "creative",
+], words=["ad", "ads", "ctr"])
+OVERALL_RE = _keyword_re([
+    "strateg", "overall", "comprehensive", "complete", "recommendation", "summary", "plan",
+    "best approach",
+])
+
+_BASED_ON_RE = re.compile(r"based on (the )?([a-z\s\-]+)")
+
+
 def router_node(state: AgentState) -> Dict[str, Any]:
     """Route dynamically based on keywords in the user prompt.
 
@@ -30,28 +88,9 @@ def router_node(state: AgentState) -> Dict[str, Any]:
     p_raw = state.get("user_prompt", "") or ""
     p = p_raw.lower()
 
-    # tightened keyword lists
-    sentiment_keywords = [
-        "sentiment", "feel", "feeling", "emotion", "mood",
-        "perception", "satisfaction", "buzz", "review", "reviews"
-    ]
-    purchase_keywords = [
-        "purchase", "buy", "buying", "sales", "transaction", "revenue",
-        "order", "orders", "acquisition", "spend", "sold", "salesdata", "sales data"
-    ]
-    campaign_keywords = [
-        "campaign", "advertise", "advertisement", "ad", "ads", "marketing",
-        "ctr", "click", "impression", "reach", "promotion", "performance", "creative"
-    ]
-    overall_keywords = [
-        "strategy", "overall", "comprehensive", "complete", "recommendation",
-        "best approach", "marketing strategy", "summary", "plan", "strategic"
-    ]
-
     # 1) Check for explicit "based on <X>" patterns
-    import re
     explicit_agent = None
-    m = re.search(r"based on (the )?([a-z\s\-]+)", p)
+    m = _BASED_ON_RE.search(p)
     if m:
         target = m.group(2).strip()
         if any(tok in target for tok in ["sentiment", "feeling", "review", "satisfaction", "buzz"]):
@@ -63,19 +102,19 @@ def router_node(state: AgentState) -> Dict[str, Any]:
 
         if explicit_agent:
             chosen = [explicit_agent, "Marketer"]
-            print(f"Router explicit 'based on' decision: '{p_raw}' -> route: {chosen}")
+            logger.debug("Router explicit 'based on' decision: %r -> route: %s", p_raw, chosen)
             return {"route": chosen}
 
     # 2) Fall back to keyword scanning
     chosen = []
-    if any(word in p for word in overall_keywords):
+    if OVERALL_RE.search(p):
         chosen = ["Sentiment", "Purchase", "Campaign"]
     else:
-        if any(word in p for word in sentiment_keywords):
+        if SENTIMENT_RE.search(p):
             chosen.append("Sentiment")
-        if any(word in p for word in purchase_keywords):
+        if PURCHASE_RE.search(p):
             chosen.append("Purchase")
-        if any(word in p for word in campaign_keywords):
+        if CAMPAIGN_RE.search(p):
             chosen.append("Campaign")
 
     # 3) Default to all if nothing matched
@@ -86,57 +125,52 @@ def router_node(state: AgentState) -> Dict[str, Any]:
     if "Marketer" not in chosen:
         chosen.append("Marketer")
 
-    print(f"Router decision: '{p_raw}' -> route: {chosen}")
+    logger.debug("Router decision: %r -> route: %s", p_raw, chosen)
     return {"route": chosen}
 
 
 # -------- Nodes --------
+def _new_messages(state: AgentState, content: Any) -> List[Dict[str, Any]]:
+    """Messages a node appends; the first node of a run also records the user turn."""
+    new = []
+    user_prompt = state.get("user_prompt", "")
+    if user_prompt and not state.get("agent_outputs"):
+        new.append({"role": "user", "content": user_prompt})
+    new.append({"role": "assistant", "content": content})
+    return new
+
+
 def sentiment_node(state: AgentState) -> Dict[str, Any]:
-    agent = SentimentAgent()
+    agent = _get_agent(SentimentAgent)
     user_prompt = state.get("user_prompt", "")
     out = agent.analyze_sentiment(user_prompt)
     out["agent"] = "sentiment"
 
     agent_outputs = state.get("agent_outputs", []) + [out]
 
-    messages = state.get("messages", [])
-    if user_prompt and (not messages or messages[-1].get("role") != "user" or messages[-1].get("content") != user_prompt):
-        messages = messages + [{"role": "user", "content": user_prompt}]
-    messages.append({"role": "assistant", "content": out})
-
-    return {"agent_outputs": agent_outputs, "messages": messages}
+    return {"agent_outputs": agent_outputs, "messages": _new_messages(state, out)}
 
 
 def purchase_node(state: AgentState) -> Dict[str, Any]:
-    agent = PurchaseAgent()
+    agent = _get_agent(PurchaseAgent)
     user_prompt = state.get("user_prompt", "")
     out = agent.analyze_purchases(user_prompt)
     out["agent"] = "purchase"
 
     agent_outputs = state.get("agent_outputs", []) + [out]
 
-    messages = state.get("messages", [])
-    if user_prompt and (not messages or messages[-1].get("role") != "user" or messages[-1].get("content") != user_prompt):
-        messages = messages + [{"role": "user", "content": user_prompt}]
-    messages.append({"role": "assistant", "content": out})
-
-    return {"agent_outputs": agent_outputs, "messages": messages}
+    return {"agent_outputs": agent_outputs, "messages": _new_messages(state, out)}
 
 
 def campaign_node(state: AgentState) -> Dict[str, Any]:
-    agent = CampaignAgent()
+    agent = _get_agent(CampaignAgent)
     user_prompt = state.get("user_prompt", "")
     out = agent.analyze_campaigns(user_prompt)
     out["agent"] = "campaign"
 
     agent_outputs = state.get("agent_outputs", []) + [out]
 
-    messages = state.get("messages", [])
-    if user_prompt and (not messages or messages[-1].get("role") != "user" or messages[-1].get("content") != user_prompt):
-        messages = messages + [{"role": "user", "content": user_prompt}]
-    messages.append({"role": "assistant", "content": out})
-
-    return {"agent_outputs": agent_outputs, "messages": messages}
+    return {"agent_outputs": agent_outputs, "messages": _new_messages(state, out)}
 
 
 def marketer_node(state: AgentState) -> Dict[str, Any]:
@@ -144,16 +178,22 @@ def marketer_node(state: AgentState) -> Dict[str, Any]:
     Run MarketerAgent to combine available specialist outputs into a final decision.
     Also append a marketer entry into agent_outputs so UIs that iterate agent_outputs
     will display the marketer's result consistently.
+
+    The full decision is only kept in final_decision; the marketer entry and message
+    carry just the summary so each checkpoint doesn't serialize the decision three times.
     """
-    agent = MarketerAgent()
+    agent = _get_agent(MarketerAgent)
 
-    outputs = state.get("agent_outputs", [])
-    sentiment_out = next((o for o in outputs if o.get("agent") == "sentiment"), {})
-    purchase_out = next((o for o in outputs if o.get("agent") == "purchase"), {})
-    campaign_out = next((o for o in outputs if o.get("agent") == "campaign"), {})
+    outputs = state.get("agent_outputs") or []
+    # first output per agent wins, matching the previous next(...) lookups
+    by_agent: Dict[str, Dict[str, Any]] = {}
+    for o in outputs:
+        by_agent.setdefault(o.get("agent"), o)
 
     # combine_insights expects (campaign, purchase, sentiment)
-    decision = agent.combine_insights(campaign_out, purchase_out, sentiment_out)
+    decision = agent.combine_insights(
+        by_agent.get("campaign", {}), by_agent.get("purchase", {}), by_agent.get("sentiment", {})
+    )
 
     # Ensure decision is a dict
     if decision is None:
@@ -162,30 +202,22 @@ def marketer_node(state: AgentState) -> Dict[str, Any]:
         # defensive: try to wrap into a dict under an obvious key
         decision = {"executive_summary": str(decision)}
 
-    # keep agent_outputs as-is, but append a marketer record for traceability
-    agent_outputs = state.get("agent_outputs", []).copy()
+    summary = decision.get("executive_summary") or decision.get("summary") or "No summary available"
 
-    # Create a safe marketer "agent output" entry so UI can display it
+    # keep agent_outputs as-is, but append a marketer record for traceability
     marketer_entry = {
         "agent": "marketer",
-        # copy top-level useful keys if present (non-destructive)
-        "summary": decision.get("executive_summary") or decision.get("summary") or "No summary available",
-        "key_findings": decision.get("key_findings", {}),
-        "final_campaign": decision.get("final_campaign", {}),
+        "summary": summary,
         "strategic_recommendations": decision.get("strategic_recommendations", decision.get("recommendations", [])),
-        # also include raw decision for debugging / PDF export
-        "raw_decision": decision,
     }
-
-    agent_outputs.append(marketer_entry)
-
-    # append marketer assistant message to conversational messages
-    messages = state.get("messages", [])
-    messages = messages + []  # defensive copy
-    messages.append({"role": "assistant", "content": decision})
+    agent_outputs = outputs + [marketer_entry]
 
     # Return final_decision (used by caller) and updated messages and agent_outputs
-    return {"final_decision": decision, "messages": messages, "agent_outputs": agent_outputs}
+    return {
+        "final_decision": decision,
+        "messages": _new_messages(state, summary),
+        "agent_outputs": agent_outputs,
+    }
 
 
 
@@ -248,15 +280,47 @@ def build_graph():
     return g.compile(checkpointer=checkpointer, store=store)
 
 
+# -------- Route-specialized graphs --------
+_ROUTE_NODES = {
+    "Sentiment": sentiment_node,
+    "Purchase": purchase_node,
+    "Campaign": campaign_node,
+    "Marketer": marketer_node,
+}
+
+
+@lru_cache(maxsize=8)
+def build_for(route: Tuple[str, ...]):
+    """
+    Compile a minimal straight-line graph containing only the nodes in `route`.
+
+    The router always emits specialists in Sentiment -> Purchase -> Campaign order
+    followed by Marketer, so 8 cache entries cover every possible route. The route is
+    decided before the graph runs, so no conditional edges are needed.
+    """
+    g = StateGraph(AgentState)
+    for name in route:
+        g.add_node(name, _ROUTE_NODES[name])
+
+    g.set_entry_point(route[0])
+    for src, dst in zip(route, route[1:]):
+        g.add_edge(src, dst)
+    g.add_edge(route[-1], END)
+
+    return g.compile()
+
+
 # -------- Public API --------
 def run_flow(user_prompt: str, thread_id: Optional[str] = None) -> AgentState:
-    app = build_graph()
+    route = router_node({"user_prompt": user_prompt})["route"]
+    app = build_for(tuple(route))
 
     if thread_id is None:
         thread_id = str(uuid.uuid4())
 
     state: AgentState = {
         "user_prompt": user_prompt,
+        "route": route,
         "agent_outputs": [],
     }
 
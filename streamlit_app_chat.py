@@ -1,13 +1,17 @@
 # streamlit_app_chat.py
 import streamlit as st
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 import pandas as pd
 import io
 from datetime import datetime, timezone
 from typing import List
 from matplotlib import pyplot as plt
 import uuid
+import html
+import hashlib
 import traceback
 
 # Ensure a persistent thread_id per browser session (small non-invasive addition)
@@ -22,9 +26,26 @@ BG_GRADIENT = "linear-gradient(180deg, #f5f6fa 0%, #ffffff 100%)"
 
 st.set_page_config(page_title="NextGen Marketer Chat", layout="wide", initial_sidebar_state="collapsed")
 
-# CSS for modern chat UI (kept original + compact tile styles)
-st.markdown(
-    f"""
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One keep-alive HTTP session per server process, so each turn skips the TCP/TLS handshake."""
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=Retry(total=2, backoff_factor=0.2))
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    try:
+        # prime the pool so the first /strategy call reuses an open connection
+        s.get(f"{API_BASE}/health", timeout=2)
+    except requests.RequestException:
+        pass
+    return s
+
+# CSS for modern chat UI (kept original + compact tile styles).
+# The script body re-executes on every rerun, so the formatted string is cached rather
+# than rebuilt; it still has to be emitted each rerun or Streamlit drops it from the page.
+@st.cache_resource
+def page_css() -> str:
+    return f"""
     <style>
     .stApp {{ background: {BG_GRADIENT}; }}
     .header {{
@@ -66,7 +87,9 @@ st.markdown(
     .rec-tile .conf {{ font-size:12px; color:#6b7280; margin-bottom:4px; }}
 
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+st.markdown(page_css(), unsafe_allow_html=True)
 
 # Header
 st.markdown("""
@@ -92,23 +115,94 @@ if "messages" not in st.session_state:
 if "raw_state" not in st.session_state:
     st.session_state["raw_state"] = {}
 
+def stream_strategy(payload: dict) -> dict:
+    """
+    POST to /strategy/stream and show each agent's progress as its SSE frame arrives.
+    Returns the final /strategy-shaped response.
+    """
+    progress = st.empty()
+    lines = []
+    data = {}
+    with get_session().post(f"{API_BASE}/strategy/stream", json=payload, timeout=120, stream=True) as r:
+        r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            frame = orjson.loads(line[len("data: "):])
+            event = frame.get("event")
+            if event == "node":
+                node = frame.get("node", "Agent")
+                if frame.get("route"):
+                    lines.append(f"🧭 {node}: " + " → ".join(frame["route"]))
+                else:
+                    lines.append(f"✅ {node}: {frame.get('summary') or 'done'}")
+                progress.markdown("\n\n".join(lines))
+            elif event == "final":
+                data = frame.get("response", {})
+            elif event == "error":
+                raise RuntimeError(frame.get("detail", "stream failed"))
+    progress.empty()
+    return data
+
+# raw_state fields the panels render (mirrors fastapi_app.DISPLAY_STATE_KEYS); the
+# fallback hash covers only these so the growing message history doesn't defeat it
+DISPLAY_STATE_KEYS = ("route", "agent_outputs", "final_decision", "campaign_output", "purchase_output")
+
+def raw_digest(raw) -> str:
+    """Stable key for a raw_state; computed once per API response to memoize derivations across reruns."""
+    blob = orjson.dumps(raw, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+@st.cache_data(max_entries=32)
+def derive_kpis(digest: str, _raw: dict) -> dict:
+    """Quick-Metrics KPIs for a raw_state; cached on its digest (_raw is not hashed)."""
+    raw = _raw if isinstance(_raw, dict) else {}
+    # derive some quick KPIs if available from raw_state fields (flexible)
+    campaign_out = raw.get("campaign_output") or {}
+    purchase_out = raw.get("purchase_output") or {}
+
+    # Basic KPIs (safe access)
+    avg_ctr = campaign_out.get("key_metrics", {}).get("avg_ctr") if campaign_out else None
+    avg_conv = campaign_out.get("key_metrics", {}).get("avg_conversion_rate") if campaign_out else None
+    top_channel = campaign_out.get("key_metrics", {}).get("top_channel") if campaign_out else None
+
+    # fallback to purchase KPI or final decision if present
+    if not avg_ctr and purchase_out.get("key_metrics"):
+        avg_ctr = purchase_out["key_metrics"].get("ctr") or avg_ctr
+
+    return {"avg_ctr": avg_ctr, "avg_conv": avg_conv, "top_channel": top_channel}
+
+# Single-line template so joined bubbles never contain blank lines that would end the
+# markdown HTML block; text is escaped and its newlines become <br>.
+_BUBBLE_TMPL = "<div class='msg-row {align}'><div class='msg-bubble' style='{style}'>{text}<div class='msg-meta'>{meta}</div></div></div>"
+_USER_BUBBLE_STYLE = f"background:{ACCENT_INDIGO}; color:white;"
+
+def _esc(value) -> str:
+    """HTML-escape a value for the markdown HTML blocks; newlines become <br> so a blank
+    line in model text can't end the block."""
+    return html.escape(str(value)).replace("\n", "<br>")
+
+def _bubble_html(m: dict) -> str:
+    role = m.get("role")
+    return _BUBBLE_TMPL.format_map({
+        "align": "user" if role == "user" else "assistant",
+        "style": _USER_BUBBLE_STYLE if role == "user" else "",
+        "text": _esc(m.get("text") or ""),
+        "meta": _esc(m.get("meta", "")),
+    })
+
 def render_chat():
-    st.markdown('<div class="chat-window">', unsafe_allow_html=True)
-    for m in st.session_state["messages"]:
-        role = m.get("role")
-        text = m.get("text")
-        meta = m.get("meta", "")
-        align = "user" if role == "user" else "assistant"
-        bubble_html = f"""
-        <div class="msg-row {align}">
-          <div class="msg-bubble" style="{ 'background:'+('#4F46E5')+'; color:white;' if role=='user' else '' }">
-            {text}
-            <div class="msg-meta">{meta}</div>
-          </div>
-        </div>
-        """
-        st.markdown(bubble_html, unsafe_allow_html=True)
-    st.markdown('</div>', unsafe_allow_html=True)
+    """
+    Emit the whole chat history as one markdown element. Bubble HTML is cached in
+    session_state["rendered_html"] (parallel to messages); only the trailing message,
+    which may still be changing, and newly appended ones are rendered on a rerun.
+    """
+    messages = st.session_state["messages"]
+    cache = st.session_state.setdefault("rendered_html", [])
+    del cache[max(0, min(len(cache), len(messages)) - 1):]
+    for m in messages[len(cache):]:
+        cache.append(_bubble_html(m))
+    st.markdown('<div class="chat-window">' + "".join(cache) + '</div>', unsafe_allow_html=True)
 
 with col1:
     st.markdown('<div class="rounded-card">', unsafe_allow_html=True)
@@ -131,15 +225,20 @@ with col1:
             # call API
             try:
                 payload = {"query": user_input, "thread_id": st.session_state.get("thread_id")}
-                r = requests.post(f"{API_BASE}/strategy", json=payload, timeout=120)
-                r.raise_for_status()
-                data = r.json()
+                data = stream_strategy(payload)
                 # Persist thread id returned by server (if any) so backend memory is consistent
                 if isinstance(data, dict) and data.get("thread_id"):
                     st.session_state["thread_id"] = data["thread_id"]
 
                 # store raw state for trace panel
-                st.session_state["raw_state"] = data.get("raw_state", data)
+                # skip the assignment when the server reports identical content, so
+                # cached derivations keyed on raw_hash stay warm
+                new_raw = data.get("raw_state", data)
+                new_hash = data.get("resp_hash") or raw_digest(
+                    {k: new_raw.get(k) for k in DISPLAY_STATE_KEYS} if isinstance(new_raw, dict) else new_raw)
+                if new_hash != st.session_state.get("raw_hash"):
+                    st.session_state["raw_state"] = new_raw
+                    st.session_state["raw_hash"] = new_hash
 
                 # Build assistant bubble from final_strategy/final_decision -> executive_summary + recs
                 final = {}
@@ -160,67 +259,64 @@ with col1:
                 st.session_state["messages"].append({"role":"assistant","text": f"Error calling API: {e}", "meta": ""})
                 print("Error calling API:", tb)
 
-with col2:
-    st.markdown('<div class="rounded-card">', unsafe_allow_html=True)
-    st.markdown("### Quick Metrics")
-    raw = st.session_state.get("raw_state", {})
-    # derive some quick KPIs if available from raw_state fields (flexible)
-    campaign_out = raw.get("campaign_output") or {}
-    purchase_out = raw.get("purchase_output") or {}
-    sentiment_out = raw.get("sentiment_output") or {}
-    final_out = raw.get("final_decision") or raw.get("final_strategy") or raw.get("final_campaign") or {}
-
-    # Basic KPIs (safe access)
-    avg_ctr = campaign_out.get("key_metrics", {}).get("avg_ctr") if campaign_out else None
-    avg_conv = campaign_out.get("key_metrics", {}).get("avg_conversion_rate") if campaign_out else None
-    top_channel = campaign_out.get("key_metrics", {}).get("top_channel") if campaign_out else None
-
-    # fallback to purchase KPI or final decision if present
-    if not avg_ctr and purchase_out.get("key_metrics"):
-        avg_ctr = purchase_out["key_metrics"].get("ctr") or avg_ctr
-
-    st.markdown(f"**Avg CTR:** {avg_ctr or '—'}")
-    st.markdown(f"**Avg Conv Rate:** {avg_conv or '—'}")
-    st.markdown(f"**Top Channel:** {top_channel or '—'}")
-    st.markdown("---")
+# -------- Right panel (metrics + agent trace) --------
+# Helper functions for small tile rendering (same format as app.py)
+def render_insight_tile_html(insight: dict):
+    audience = insight.get("audience_segment") or insight.get("audience") or insight.get("segment") or "-"
+    product = insight.get("product_focus") or insight.get("product") or "-"
+    region = insight.get("region") or insight.get("regions") or "-"
+    signal = insight.get("signal") or insight.get("note") or ""
+    confidence = insight.get("confidence")
+    conf_text = f"{confidence:.2f}" if isinstance(confidence, (float, int)) else (str(confidence) if confidence else "-")
+    tile = f"""
+    <div class="insight-tile">
+      <div class="k">Audience</div><div class="v">{_esc(audience)}</div>
+      <div class="k">Product</div><div class="v">{_esc(product)}</div>
+      <div class="k">Region</div><div class="v">{_esc(region)}</div>
+      <div class="k">Signal</div><div class="v">{_esc(signal)}</div>
+      <div class="k">Confidence</div><div class="v">{_esc(conf_text)}</div>
+    </div>
+    """
+    return tile.strip()
+
+def render_rec_tile_html(rec: dict):
+    idea = rec.get("idea") or rec.get("campaign_name") or rec.get("concept") or str(rec)
+    confidence = rec.get("confidence")
+    conf_text = f"{confidence:.2f}" if isinstance(confidence, (float, int)) else (str(confidence) if confidence else "-")
+    tile = f"""
+    <div class="rec-tile">
+      <div class="idea">{_esc(idea)}</div>
+      <div class="conf">Confidence: {_esc(conf_text)}</div>
+    </div>
+    """
+    return tile.strip()
+
+def notice_html(text: str):
+    return f"<div class='small-muted' style='padding:6px 0;'>{text}</div>"
+
+@st.cache_data(max_entries=32)
+def right_panel_html(digest: str, _raw: dict) -> str:
+    """
+    Build the whole right panel as one HTML string (emitted with a single st.markdown;
+    expanders are native <details> elements). Cached on the raw_state digest. Fragments
+    are stripped so no blank line ends the HTML block and turns indented tiles into code.
+    """
+    parts = ['<div class="rounded-card">', "<h3>Quick Metrics</h3>"]
+    raw = _raw if isinstance(_raw, dict) else {}
+    kpis = derive_kpis(digest, raw)
+    avg_ctr, avg_conv, top_channel = kpis["avg_ctr"], kpis["avg_conv"], kpis["top_channel"]
+
+    parts.append(f"<p><strong>Avg CTR:</strong> {_esc(avg_ctr or '—')}</p>")
+    parts.append(f"<p><strong>Avg Conv Rate:</strong> {_esc(avg_conv or '—')}</p>")
+    parts.append(f"<p><strong>Top Channel:</strong> {_esc(top_channel or '—')}</p>")
+    parts.append("<hr>")
 
     # Agent Trace - only show sections for agents that ran in the last raw_state
     route = raw.get("route", []) if isinstance(raw, dict) else []
     routed_agents = [r.lower() for r in route] if route else []
 
-    st.markdown("### Agent Trace")
-    # Helper functions for small tile rendering (same format as app.py)
-    def render_insight_tile_html(insight: dict):
-        audience = insight.get("audience_segment") or insight.get("audience") or insight.get("segment") or "-"
-        product = insight.get("product_focus") or insight.get("product") or "-"
-        region = insight.get("region") or insight.get("regions") or "-"
-        signal = insight.get("signal") or insight.get("note") or ""
-        confidence = insight.get("confidence")
-        conf_text = f"{confidence:.2f}" if isinstance(confidence, (float, int)) else (str(confidence) if confidence else "-")
-        html = f"""
-        <div class="insight-tile">
-          <div class="k">Audience</div><div class="v">{audience}</div>
-          <div class="k">Product</div><div class="v">{product}</div>
-          <div class="k">Region</div><div class="v">{region}</div>
-          <div class="k">Signal</div><div class="v">{st.experimental_singleton(lambda s=signal: s)()}</div>
-          <div class="k">Confidence</div><div class="v">{conf_text}</div>
-        </div>
-        """
-        return html
-
-    def render_rec_tile_html(rec: dict):
-        idea = rec.get("idea") or rec.get("campaign_name") or rec.get("concept") or str(rec)
-        confidence = rec.get("confidence")
-        conf_text = f"{confidence:.2f}" if isinstance(confidence, (float, int)) else (str(confidence) if confidence else "-")
-        html = f"""
-        <div class="rec-tile">
-          <div class="idea">{idea}</div>
-          <div class="conf">Confidence: {conf_text}</div>
-        </div>
-        """
-        return html
-
-    # For each routed agent, produce an expander and show tiles
+    parts.append("<h3>Agent Trace</h3>")
+    # For each routed agent, produce a collapsible section and show tiles
     agent_outputs = raw.get("agent_outputs") or []
     # convert to list of dicts if needed
     if isinstance(agent_outputs, dict):
@@ -232,51 +328,48 @@ with col2:
             # if agent was not routed, skip or show disabled
             continue
 
-        with st.expander(f"🔎 {agent_name} Agent Output", expanded=False):
-            # summary
-            summary = out.get("summary") or out.get("summary_text") or "No summary available"
-            st.markdown(f"**Summary:** {summary}")
-
-            # insights
-            insights = out.get("insights") or []
-            if isinstance(insights, dict):
-                insights = [insights]
-            if insights:
-                st.markdown("**Insights:**")
-                html_blocks = []
-                for ins in insights:
-                    if isinstance(ins, dict):
-                        html_blocks.append(render_insight_tile_html(ins))
-                    else:
-                        # fallback string
-                        html_blocks.append(f"<div class='insight-tile'><div class='k'>Signal</div><div class='v'>{ins}</div></div>")
-                st.markdown("".join(html_blocks), unsafe_allow_html=True)
-            else:
-                st.info("No insights found for this agent.")
-
-            # recommendations
-            recs = out.get("recommendations") or out.get("recommendation") or []
-            if isinstance(recs, dict):
-                recs = [recs]
-            if recs:
-                st.markdown("**Recommendations:**")
-                html_blocks = []
-                for r in recs:
-                    if isinstance(r, dict):
-                        html_blocks.append(render_rec_tile_html(r))
-                    else:
-                        html_blocks.append(f"<div class='rec-tile'><div class='idea'>{r}</div><div class='conf'>Confidence: -</div></div>")
-                st.markdown("".join(html_blocks), unsafe_allow_html=True)
-            else:
-                st.info("No recommendations found for this agent.")
-
-    st.markdown("---")
-    st.markdown("### Final Marketer Strategy")
+        parts.append(f"<details><summary>🔎 {_esc(agent_name)} Agent Output</summary>")
+        # summary
+        summary = out.get("summary") or out.get("summary_text") or "No summary available"
+        parts.append(f"<p><strong>Summary:</strong> {_esc(summary)}</p>")
+
+        # insights
+        insights = out.get("insights") or []
+        if isinstance(insights, dict):
+            insights = [insights]
+        if insights:
+            parts.append("<p><strong>Insights:</strong></p>")
+            for ins in insights:
+                if isinstance(ins, dict):
+                    parts.append(render_insight_tile_html(ins))
+                else:
+                    # fallback string
+                    parts.append(f"<div class='insight-tile'><div class='k'>Signal</div><div class='v'>{_esc(ins)}</div></div>")
+        else:
+            parts.append(notice_html("No insights found for this agent."))
+
+        # recommendations
+        recs = out.get("recommendations") or out.get("recommendation") or []
+        if isinstance(recs, dict):
+            recs = [recs]
+        if recs:
+            parts.append("<p><strong>Recommendations:</strong></p>")
+            for r in recs:
+                if isinstance(r, dict):
+                    parts.append(render_rec_tile_html(r))
+                else:
+                    parts.append(f"<div class='rec-tile'><div class='idea'>{_esc(r)}</div><div class='conf'>Confidence: -</div></div>")
+        else:
+            parts.append(notice_html("No recommendations found for this agent."))
+        parts.append("</details>")
+
+    parts.append("<hr>")
+    parts.append("<h3>Final Marketer Strategy</h3>")
     final = raw.get("final_decision") or raw.get("final_strategy") or raw.get("final_campaign") or {}
     if final:
         # show executive summary
         exec_sum = final.get("executive_summary") or final.get("summary") or "No summary available"
-        st.markdown(f"**Executive Summary:** {exec_sum}")
+        parts.append(f"<p><strong>Executive Summary:</strong> {_esc(exec_sum)}</p>")
         # final campaign (if any)
         fc = final.get("final_campaign") or final.get("final_strategy") or final.get("final_campaign")
         if isinstance(final.get("final_campaign"), dict):
@@ -285,11 +378,21 @@ with col2:
             fc = final if "campaign_name" in final else fc
 
         if fc and isinstance(fc, dict) and fc.get("campaign_name"):
-            st.markdown("**Final Campaign (preview)**")
-            st.markdown(render_rec_tile_html(fc), unsafe_allow_html=True)
+            parts.append("<p><strong>Final Campaign (preview)</strong></p>")
+            parts.append(render_rec_tile_html(fc))
         else:
-            st.info("No final campaign available.")
+            parts.append(notice_html("No final campaign available."))
 
-    st.markdown('</div>', unsafe_allow_html=True)
+    parts.append("</div>")
+    parts.append("<div style='text-align:center; padding:8px; color:#6b7280;'>Model: v1.0 • Embedding: mxbai-embed-large • UI by NextGen Marketer</div>")
+
+    return "".join(parts)
 
-    st.markdown("<div style='text-align:center; padding:8px; color:#6b7280;'>Model: v1.0 • Embedding: mxbai-embed-large • UI by NextGen Marketer</div>", unsafe_allow_html=True)
+@st.fragment
+def right_panel():
+    # runs as part of every full rerun, but the HTML only changes when a new API
+    # response bumps raw_hash; interactions inside the fragment rerun only this
+    st.markdown(right_panel_html(st.session_state.get("raw_hash", ""), st.session_state.get("raw_state", {})), unsafe_allow_html=True)
+
+with col2:
+    right_panel()
@@ -0,0 +1,35 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils.embed_store import EmbedStore
+
+
+def test_roundtrip_and_reopen(tmp_path):
+    store = EmbedStore(tmp_path)
+    assert store.missing(["a", "b"]) == ["a", "b"]
+    store.append(["a", "b"], np.array([[0, 1, 2, 3], [4, 5, 6, 7]], dtype=np.float32))
+
+    reopened = EmbedStore(tmp_path)
+    assert reopened.missing(["a", "c"]) == ["c"]
+    np.testing.assert_array_equal(reopened.get(["b", "a"]), [[4, 5, 6, 7], [0, 1, 2, 3]])
+
+
+def test_partial_write_does_not_misalign_later_rows(tmp_path):
+    store = EmbedStore(tmp_path)
+    store.append(["a"], np.array([[0, 1, 2, 3]]))
+    # simulate an append interrupted after some vector bytes but before its index line
+    with open(tmp_path / "vectors.bin", "ab") as f:
+        f.write(b"\x01\x02\x03")
+
+    store.append(["b"], np.array([[4, 5, 6, 7]]))
+    np.testing.assert_array_equal(EmbedStore(tmp_path).get(["a", "b"]), [[0, 1, 2, 3], [4, 5, 6, 7]])
+
+
+def test_float32_store_keeps_full_precision(tmp_path):
+    vec = np.array([[0.1, 0.2, 0.3]], dtype=np.float32)
+    store = EmbedStore(tmp_path, dtype=np.float32)
+    store.append(["a"], vec)
+    out = EmbedStore(tmp_path).get(["a"])
+    assert out.dtype == np.float32
+    np.testing.assert_array_equal(out, vec)
@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("ollama")
+pytest.importorskip("orjson")
+
+from utils.llm_utils import _extract_json, _first_balanced_object, _complete_partial_json
+
+
+@pytest.mark.parametrize("content, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('Sure! {"a": {"b": "}"}} hope that helps', {"a": {"b": "}"}}),
+    ('Here {note} then {"a": 1}', {"a": 1}),
+    ('[{"x": 1}, {"y"', [{"x": 1}, {"y": None}]),
+    ('{"summary": "cut off mid', {"summary": "cut off mid"}),
+    ('{"a": [1, 2', {"a": [1, 2]}),
+    ('{"summary": "Sales up", "key_metrics": {"ctr": 0.12}, "insights": [{"signal": "cut off',
+     {"summary": "Sales up", "key_metrics": {"ctr": 0.12}, "insights": [{"signal": "cut off"}]}),
+])
+def test_extract_json(content, expected):
+    assert _extract_json(content) == expected
+
+
+def test_extract_json_gives_up_on_prose():
+    assert _extract_json("no json here") is None
+
+
+def test_first_balanced_object_ignores_braces_in_strings():
+    assert _first_balanced_object('x {"a": "}{", "b": {"c": 1}} tail') == '{"a": "}{", "b": {"c": 1}}'
+
+
+def test_complete_partial_json_dangling_key_and_literal():
+    assert _complete_partial_json('{"a": tr') == {"a": True}
+    assert _complete_partial_json('{"a": 1, "b"') == {"a": 1, "b": None}
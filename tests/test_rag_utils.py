@@ -0,0 +1,64 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+np = pytest.importorskip("numpy")
+pytest.importorskip("chromadb")
+pytest.importorskip("sentence_transformers")
+
+from utils import rag_utils
+
+
+class FakeCollection:
+    def __init__(self):
+        self.added = []
+
+    def get(self, where=None, include=None):
+        return {"metadatas": []}
+
+    def add(self, **kwargs):
+        self.added.append(kwargs)
+
+
+@pytest.fixture
+def coll(monkeypatch):
+    c = FakeCollection()
+    monkeypatch.setattr(rag_utils, "get_collection", lambda namespace: c)
+    monkeypatch.setattr(rag_utils, "_doc_embeddings", lambda docs, shas: np.zeros((len(docs), 4), dtype=np.float32))
+    return c
+
+
+def test_upsert_without_meta_cols(coll):
+    df = pd.DataFrame({"a": ["x", None, "z"], "b": [1, 2, None]})
+    rag_utils.upsert_dataframe_as_docs(df, "ns", text_cols=["a", "b"])
+
+    (call,) = coll.added
+    assert call["documents"] == ["x | 1.0", "2.0", "z"]
+    assert len(call["metadatas"]) == len(call["ids"]) == 3
+    assert all(set(m) == {"sha"} for m in call["metadatas"])
+
+
+def test_upsert_drops_duplicate_rows(coll):
+    df = pd.DataFrame({"a": ["x", "x", "y", "x"], "m": [1, 1, None, 2]})
+    rag_utils.upsert_dataframe_as_docs(df, "ns", text_cols=["a"], meta_cols=["m"])
+
+    (call,) = coll.added
+    assert call["documents"] == ["x", "y", "x"]
+    assert [m["m"] for m in call["metadatas"]] == [1, None, 2]
+
+
+def test_query_embeddings_embed_only_cache_misses(monkeypatch):
+    calls = []
+
+    def fake_embed(texts):
+        calls.append(list(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+    monkeypatch.setattr(rag_utils, "_embed", fake_embed)
+    rag_utils.clear_query_cache()
+
+    rag_utils._embed_queries(["a", "bb"])
+    out = rag_utils._embed_queries(["bb", "ccc", "a"])
+
+    assert calls == [["a", "bb"], ["ccc"]]
+    assert out.dtype == np.float32
+    np.testing.assert_array_equal(out[:, 0], [2, 3, 1])
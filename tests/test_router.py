@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("langgraph")
+
+from orchestrator import router_node
+
+
+def route(prompt):
+    return router_node({"user_prompt": prompt})["route"]
+
+
+@pytest.mark.parametrize("prompt, expected", [
+    ("Which customers purchased SUVs?", ["Purchase", "Marketer"]),
+    ("How did customers who purchased the hatchback feel?", ["Sentiment", "Purchase", "Marketer"]),
+    ("Analyze our promotional emails", ["Campaign", "Marketer"]),
+    ("Which models were ordered most last quarter?", ["Purchase", "Marketer"]),
+    ("What did buyers say when they reviewed the sedan?", ["Sentiment", "Purchase", "Marketer"]),
+    ("Which advertised offers got clicked?", ["Campaign", "Marketer"]),
+    ("Give me top 5 campaign ideas based on customer sentiments", ["Sentiment", "Marketer"]),
+    ("Recommend a strategy using sentiments + purchase behavior", ["Sentiment", "Purchase", "Campaign", "Marketer"]),
+    ("What's the best overall campaign strategy?", ["Sentiment", "Purchase", "Campaign", "Marketer"]),
+])
+def test_keyword_routes(prompt, expected):
+    assert route(prompt) == expected
+
+
+def test_short_keywords_match_whole_words_only():
+    # "ad" must not fire inside "made"/"add"; nothing else matches, so all specialists run
+    assert route("What made customers add accessories?") == ["Sentiment", "Purchase", "Campaign", "Marketer"]
+    assert route("Which ads had the best CTR?") == ["Campaign", "Marketer"]
+
+
+def test_no_keywords_routes_to_all():
+    assert route("Hello there") == ["Sentiment", "Purchase", "Campaign", "Marketer"]
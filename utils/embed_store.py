@@ -0,0 +1,96 @@
+# embed_store.py
+"""
+Append-only on-disk store of document embeddings keyed by content hash, so a document
+that was embedded once (in any namespace) is never encoded again, even after its
+Chroma collection is dropped or rebuilt.
+
+Layout under `root`:
+  vectors.bin  row-major vectors (float16 by default), one row per key
+  index.jsonl  {"sha": <key>, "row": <n>} per line
+  meta.json    {"dim": <vector dimension>, "dtype": <numpy dtype name>}
+
+The index is the source of truth: a vector only counts once its index line is written,
+and bytes past the last indexed row (e.g. from an interrupted append) are cut off before
+the next append so rows stay aligned. Reads memory-map the vector file, re-reading the
+index first so rows appended since the store was opened are visible. Writes assume one
+writer per store at a time.
+"""
+import json
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class EmbedStore:
+    def __init__(self, root: str, dtype=np.float16):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._vec_path = self.root / "vectors.bin"
+        self._index_path = self.root / "index.jsonl"
+        self._meta_path = self.root / "meta.json"
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._num_rows = 0  # rows covered by the index
+        self._index_pos = 0  # bytes of index.jsonl already loaded
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def _refresh(self):
+        """Load index lines appended since the last refresh."""
+        if self.dim is None and self._meta_path.exists():
+            meta = json.loads(self._meta_path.read_text())
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+        if not self._index_path.exists():
+            return
+        with open(self._index_path, "rb") as f:
+            f.seek(self._index_pos)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partially written line; pick it up next time
+                rec = json.loads(line)
+                self._rows[rec["sha"]] = rec["row"]
+                self._num_rows = max(self._num_rows, rec["row"] + 1)
+                self._index_pos += len(line)
+
+    def missing(self, keys: List[str]) -> List[str]:
+        """Keys with no stored vector."""
+        with self._lock:
+            if any(k not in self._rows for k in keys):
+                self._refresh()
+            return [k for k in keys if k not in self._rows]
+
+    def append(self, keys: List[str], embs: np.ndarray) -> List[int]:
+        """Store one vector per key (in the store's dtype); returns their row offsets."""
+        embs = np.ascontiguousarray(embs, dtype=self.dtype)
+        with self._lock:
+            self._refresh()
+            if self.dim is None:
+                self.dim = int(embs.shape[1])
+                self._meta_path.write_text(json.dumps({"dim": self.dim, "dtype": self.dtype.name}))
+            start = self._num_rows
+            end_of_rows = start * self.dim * self.dtype.itemsize
+            with open(self._vec_path, "ab") as f:
+                # drop anything after the last indexed row so the new rows land at `start`
+                if f.tell() != end_of_rows:
+                    f.truncate(end_of_rows)
+                    f.seek(end_of_rows)
+                f.write(embs.tobytes())
+            rows = list(range(start, start + len(keys)))
+            with open(self._index_path, "ab") as f:
+                f.write(b"".join(json.dumps({"sha": k, "row": r}).encode() + b"\n" for k, r in zip(keys, rows)))
+            self._refresh()
+        return rows
+
+    def get(self, keys: List[str]) -> np.ndarray:
+        """Stored vectors for keys, in order, as a (len(keys), dim) array of the store's dtype."""
+        with self._lock:
+            if any(k not in self._rows for k in keys):
+                self._refresh()
+            rows = [self._rows[k] for k in keys]
+            n = self._num_rows
+        mm = np.memmap(self._vec_path, dtype=self.dtype, mode="r", shape=(n, self.dim))
+        return np.array(mm[rows])
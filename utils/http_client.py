@@ -0,0 +1,49 @@
+# http_client.py
+import os
+import atexit
+import itertools
+import httpx
+import ollama
+
+# One Ollama client (and therefore one httpx connection pool) for the whole process.
+# The agents all talk to the same local Ollama server, so sharing the pool lets the
+# parallel agent calls reuse keep-alive connections instead of reconnecting per call.
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST")  # None -> ollama's default (localhost:11434)
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "300"))
+# Comma-separated list of Ollama servers (e.g. one numactl-pinned `ollama serve` per CPU
+# socket). Requests are spread across them round-robin; unset means just OLLAMA_HOST.
+OLLAMA_ENDPOINTS = [h.strip() for h in os.environ.get("OLLAMA_ENDPOINTS", "").split(",") if h.strip()]
+
+
+def _make_client(host):
+    return ollama.Client(
+        host=host,
+        timeout=OLLAMA_TIMEOUT,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    )
+
+
+class RoundRobinClient:
+    """Drop-in for ollama.Client that sends each call to the next endpoint in turn."""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self._next = itertools.cycle(clients)
+
+    def __getattr__(self, name):
+        return getattr(next(self._next), name)
+
+
+# one pooled client per endpoint; per-server work (e.g. warmup) iterates these directly
+OLLAMA_CLIENTS = [_make_client(h) for h in OLLAMA_ENDPOINTS] or [_make_client(OLLAMA_HOST)]
+SHARED_OLLAMA_CLIENT = OLLAMA_CLIENTS[0] if len(OLLAMA_CLIENTS) == 1 else RoundRobinClient(OLLAMA_CLIENTS)
+
+
+def _close_shared_client():
+    for c in OLLAMA_CLIENTS:
+        http = getattr(c, "_client", None)
+        if http is not None:
+            http.close()
+
+
+atexit.register(_close_shared_client)
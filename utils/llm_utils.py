@@ -1,8 +1,19 @@
 # llm_utils.py  (patched)
+import os
+import re
+import asyncio
 import ollama
 import json
+import orjson
+import hashlib
 import logging
-from typing import Optional, Any, Dict
+from contextlib import asynccontextmanager
+from types import MappingProxyType
+from typing import Optional, Any, Dict, List, Iterator
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from utils.http_client import (SHARED_OLLAMA_CLIENT, OLLAMA_CLIENTS, OLLAMA_HOST, OLLAMA_ENDPOINTS,
+                               OLLAMA_TIMEOUT, RoundRobinClient)
 
 logger = logging.getLogger("llm_utils")
 logger.setLevel(logging.INFO)
@@ -11,116 +22,373 @@ if not logger.handlers:
     ch.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
     logger.addHandler(ch)
 
-# Default options you were using; we keep these but allow caller override
-OLLAMA_OPTIONS = {
-    "keep_alive": "30m",  # keep model hot in VRAM/RAM
-    "num_ctx": 2048,      # context size
+# Default options you were using; we keep these but allow caller override.
+# Read-only; each call gets its own copy from _call_options().
+OLLAMA_OPTIONS = MappingProxyType({
+    # context size; keep it fixed per model -- Ollama reloads the model whenever num_ctx changes
+    "num_ctx": int(os.environ.get("OLLAMA_NUM_CTX", "2048")),
     "num_predict": 400,   # response token cap (increase if you get truncation)
     "temperature": 0.2,
     "top_p": 0.9,
     # "num_thread": 0,    # optional
-}
+})
+# keep model hot in VRAM/RAM; this is a request field, not a model option
+OLLAMA_KEEP_ALIVE = "30m"
+
+# Repair calls run on this pool so ask_ollama can stop waiting after REPAIR_TIMEOUT
+# seconds instead of blocking the request on a slow second generation.
+REPAIR_TIMEOUT = float(os.environ.get("OLLAMA_REPAIR_TIMEOUT", "20"))
+_REPAIR_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ollama-repair")
+
+# On-disk cache of raw model output keyed by (model, system, prompt, options); JSON
+# recovery is re-run on read. In json_mode only output that parsed and wasn't cut off
+# by num_predict (done_reason "length") is stored, and entries expire after
+# LLM_CACHE_TTL seconds so answers to the same question refresh.
+# Disabled if diskcache isn't installed or LLM_CACHE_DIR is set to "".
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", ".llm_cache")
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", "3600"))
+_CACHE = diskcache.Cache(LLM_CACHE_DIR, size_limit=2 << 30) if diskcache and LLM_CACHE_DIR else None
+
+def _cache_key(model: str, prompt: str, opts, system: Optional[str] = None) -> str:
+    blob = orjson.dumps([model, system, prompt, dict(opts)], option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(blob, digest_size=16).hexdigest()
+
+def _cache_put(key: Optional[str], content: str, resp=None) -> None:
+    # skip output cut off by num_predict: local completion would serve the truncated answer
+    if key and (resp is None or resp.get("done_reason") != "length"):
+        _CACHE.set(key, content, expire=LLM_CACHE_TTL)
+
+# JSON answers get a smaller decode budget by default. num_predict can vary per call
+# without reloading the model; num_ctx cannot, so it stays at OLLAMA_OPTIONS' value.
+JSON_MAX_OUTPUT_TOKENS = 256
+REPAIR_MAX_OUTPUT_TOKENS = 800
+
+def _rough_token_count(s: str) -> int:
+    return len(s) // 3
+
+def _call_options(json_mode: bool, options: Optional[Dict],
+                  max_output_tokens: Optional[int], ctx: Optional[int]) -> Dict[str, Any]:
+    """OLLAMA_OPTIONS with this call's output budget; explicit `options` entries still win."""
+    if max_output_tokens is None:
+        max_output_tokens = JSON_MAX_OUTPUT_TOKENS if json_mode else OLLAMA_OPTIONS["num_predict"]
+    opts = {**OLLAMA_OPTIONS, "num_predict": max_output_tokens}
+    if ctx is not None:
+        opts["num_ctx"] = ctx
+    opts.update(options or {})
+    return opts
+
+def _messages(prompt: str, system: Optional[str]) -> List[Dict[str, str]]:
+    # a stable system message lets Ollama reuse the prefix's KV cache across calls
+    msgs = [{"role": "system", "content": system}] if system else []
+    msgs.append({"role": "user", "content": prompt})
+    return msgs
 
 def _safe_json_load(s: str) -> Optional[Any]:
     """Try to parse JSON string s; return Python object or None."""
+    try:
+        return orjson.loads(s)
+    except (orjson.JSONDecodeError, TypeError):
+        # orjson is strict about NaN/Infinity, which stdlib json accepts
+        if not isinstance(s, str) or ("NaN" not in s and "Infinity" not in s):
+            return None
     try:
         return json.loads(s)
     except Exception:
         return None
 
-def _extract_largest_brace_group(s: str) -> Optional[str]:
+class _ObjectScanner:
     """
-    Find the largest substring that starts with '{' and ends with '}' (by outermost match).
-    This is a heuristic to pull JSON out of mixed output.
+    Incremental balanced-brace scanner: feed text as it arrives and get back the first
+    complete {...} object (braces inside JSON strings are ignored) once it closes.
     """
-    start = s.find('{')
-    end = s.rfind('}')
-    if start == -1 or end == -1 or end <= start:
+
+    def __init__(self):
+        self.text = ""
+        self.start = -1
+        self.depth = 0
+        self.in_string = self.escape = False
+
+    def feed(self, chunk: str) -> Optional[str]:
+        pos = len(self.text)
+        self.text += chunk
+        if self.start == -1:
+            pos = self.text.find("{", pos)
+            if pos == -1:
+                return None
+            self.start = pos
+        for i in range(pos, len(self.text)):
+            ch = self.text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return self.text[self.start:i + 1]
         return None
-    candidate = s[start:end+1]
-    return candidate
 
-def _close_braces_heuristic(s: str) -> str:
+def _first_balanced_object(s: str) -> Optional[str]:
     """
-    If JSON was cut off, attempt to balance braces by appending missing closing braces.
-    Simple heuristic: count '{' vs '}' and append '}' as needed.
+    Return the first balanced {...} substring of s, scanning once left to right and
+    ignoring braces inside JSON strings. Unlike a first-'{'/last-'}' slice this doesn't
+    swallow stray braces in surrounding prose. Returns None if no object closes.
     """
-    opens = s.count('{')
-    closes = s.count('}')
-    if opens > closes:
-        s = s + ('}' * (opens - closes))
-    return s
+    return _ObjectScanner().feed(s)
 
-def ask_ollama(prompt: str, model: str, json_mode: bool = True, options: Optional[Dict] = None, repair_attempts: int = 2) -> Any:
+MAX_OBJECT_CANDIDATES = 16
+
+def _balanced_objects(s: str):
+    """
+    Yield balanced {...} substrings of s starting from successive '{' positions, so a
+    stray brace pair in prose ("{note}") doesn't hide a valid object after it. Bounded
+    by MAX_OBJECT_CANDIDATES start positions. Stops at the first '{' that never closes:
+    every later '{' is nested inside it, so the whole object is left for completion.
     """
-    Ask Ollama for an answer. If json_mode=True, attempt robust JSON parsing and
-    repair via additional calls if the model returns invalid JSON.
+    start = s.find("{")
+    for _ in range(MAX_OBJECT_CANDIDATES):
+        if start == -1:
+            return
+        candidate = _ObjectScanner().feed(s[start:])
+        if candidate is None:
+            return
+        yield candidate
+        start = s.find("{", start + 1)
+
+_PARTIAL_LITERALS = ("true", "false", "null")
+_TRAILING_SCALAR_RE = re.compile(r"[A-Za-z0-9.+\-]+$")
+_PARTIAL_UNICODE_ESCAPE_RE = re.compile(r"\\u[0-9a-fA-F]{0,3}$")
+
+def _complete_partial_json(s: str) -> Optional[Any]:
+    """
+    Parse JSON that was cut off mid-output (e.g. the model hit num_predict) in one pass.
+    Starting at the first '{' or '[', track open containers and string state; if the
+    root closes, parse up to there (ignoring trailing prose). Otherwise complete the
+    tail: terminate a dangling string, give a key with no value null, finish partial
+    true/false/null or number tokens, drop a trailing comma, and close every open
+    container. Returns None if there is no root object/array or it still won't parse.
+    """
+    m = re.search(r"[\[{]", s or "")
+    if not m:
+        return None
+    s = s[m.start():]
+
+    stack = []        # open containers, '{' or '['
+    awaiting_key = [] # parallel to stack: object is between '{'/',' and ':' (key not yet followed by a colon)
+    in_string = escape = False
+    for i, ch in enumerate(s):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+            awaiting_key.append(ch == "{")
+        elif ch in "}]":
+            stack.pop()
+            awaiting_key.pop()
+            if not stack:
+                return _safe_json_load(s[:i + 1])
+        elif ch == ":":
+            awaiting_key[-1] = False
+        elif ch == ",":
+            awaiting_key[-1] = stack[-1] == "{"
+
+    out = s
+    if in_string:
+        if escape:
+            out = out[:-1]
+        out = _PARTIAL_UNICODE_ESCAPE_RE.sub("", out) + '"'
+
+    out = out.rstrip()
+    if out.endswith(","):
+        out = out[:-1].rstrip()
+    elif out.endswith(":"):
+        out += " null"
+    elif stack[-1] == "{" and awaiting_key[-1]:
+        if out.endswith('"'):
+            out += ": null"
+    else:
+        tm = _TRAILING_SCALAR_RE.search(out)
+        if tm:
+            tok = tm.group(0)
+            lit = next((l for l in _PARTIAL_LITERALS if l.startswith(tok)), None)
+            if lit is None:
+                lit = tok.rstrip(".eE+-")
+                if not lit or lit in "+-":
+                    lit = "null"
+            out = out[:tm.start()] + lit
+
+    out += "".join("}" if c == "{" else "]" for c in reversed(stack))
+    return _safe_json_load(out)
+
+def _extract_json(content: str) -> Optional[Any]:
+    """
+    Recover JSON from model output without another LLM call: direct parse, then the
+    first balanced {...} object that parses, then completion of truncated output.
+    None if all fail.
+    """
+    # 1) Try direct JSON parse
+    parsed = _safe_json_load(content)
+    if parsed is not None:
+        return parsed
+
+    # A top-level array goes to the completer first; object extraction would return
+    # just its first element when the array is truncated
+    m = re.search(r"[\[{]", content or "")
+    if m and m.group(0) == "[":
+        parsed = _complete_partial_json(content)
+        if parsed is not None:
+            return parsed
+
+    # 2) Try balanced {...} objects embedded in the output, skipping ones that don't parse
+    for candidate in _balanced_objects(content or ""):
+        parsed = _safe_json_load(candidate)
+        if parsed is not None:
+            return parsed
+
+    # 3) Complete truncated JSON locally (dangling strings/keys/literals, open containers)
+    return _complete_partial_json(content)
+
+_REPAIR_PROMPT_TEMPLATE = (
+    "The previous response was supposed to be valid JSON but it is invalid or truncated.\n"
+    "Please extract and return only the corrected, valid JSON object (no explanation, no markdown).\n"
+    "Here is the raw output that needs fixing:\n\n"
+    "<<<RAW_OUTPUT>>>\n\n"
+    "Return just valid JSON (object or array). If fields are truncated, try to complete them reasonably."
+)
+
+def _repair_request(content: str, opts) -> Dict[str, Any]:
+    """Prompt and options for asking the model to repair its own output."""
+    repair_prompt = _REPAIR_PROMPT_TEMPLATE.replace("<<<RAW_OUTPUT>>>", content)
+    # Give the model room to return the full JSON, but within what the (unchanged)
+    # context has left after the repair prompt, which embeds the whole broken output
+    repair_opts = dict(opts)
+    room = repair_opts["num_ctx"] - _rough_token_count(repair_prompt)
+    want = max(repair_opts.get("num_predict", 400), REPAIR_MAX_OUTPUT_TOKENS)
+    repair_opts["num_predict"] = max(JSON_MAX_OUTPUT_TOKENS, min(want, room))
+    return {
+        "messages": [{"role": "user", "content": repair_prompt}],
+        "options": repair_opts,
+    }
+
+def warmup_model(model: str, client: Optional[ollama.Client] = None) -> bool:
+    """
+    Load `model` into Ollama ahead of the first real request by generating a single
+    token, on `client` or else on every configured endpoint (OLLAMA_ENDPOINTS).
+    Returns False (and logs) if any server isn't reachable.
+    """
+    ok = True
+    for c in ([client] if client is not None else OLLAMA_CLIENTS):
+        try:
+            c.chat(
+                model=model,
+                messages=[{"role": "user", "content": "ping"}],
+                # same num_ctx as real calls, or the first of them reloads the model
+                options={"num_ctx": OLLAMA_OPTIONS["num_ctx"], "num_predict": 1},
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                stream=False,
+            )
+        except Exception as e:
+            logger.warning("Warmup of model %s failed: %s", model, e)
+            ok = False
+    return ok
+
+def ask_ollama(prompt: str, model: str, json_mode: bool = True, options: Optional[Dict] = None, repair_attempts: int = 1,
+               client: Optional[ollama.Client] = None, repair_timeout: Optional[float] = None,
+               max_output_tokens: Optional[int] = None, ctx: Optional[int] = None, use_cache: bool = True,
+               system: Optional[str] = None) -> Any:
+    """
+    Ask Ollama for an answer. If json_mode=True, attempt robust JSON parsing, completing
+    truncated output locally, and only ask the model to repair its output if no JSON
+    object can be recovered at all.
     - options: dict to override OLLAMA_OPTIONS for this call (e.g., {"num_predict": 800})
     - repair_attempts: number of attempts to ask the model to repair its own output
+    - client: ollama.Client to use; defaults to the process-wide shared client
+    - repair_timeout: seconds to wait for each repair call (default REPAIR_TIMEOUT)
+    - max_output_tokens: num_predict for this call (default JSON_MAX_OUTPUT_TOKENS in json_mode)
+    - ctx: num_ctx for this call (default OLLAMA_OPTIONS'; a different value reloads the model)
+    - use_cache: reuse/store the raw response in the on-disk cache (False forces a fresh call)
+    - system: fixed instructions sent as a system message ahead of `prompt`; keep it
+      identical across calls so Ollama can reuse its cached prefix
     Returns:
       - parsed JSON (dict/list) on success
       - string content if json_mode=False
       - on failure (after retries): {"error":"Invalid JSON","raw": "<raw content>"}
     """
-    opts = dict(OLLAMA_OPTIONS)
-    if options:
-        opts.update(options)
+    client = client or SHARED_OLLAMA_CLIENT
+    opts = _call_options(json_mode, options, max_output_tokens, ctx)
+
+    key = _cache_key(model, prompt, opts, system) if use_cache and _CACHE is not None else None
+    content = _CACHE.get(key) if key else None
+    fresh = content is None
 
     # Primary LLM call
-    try:
-        resp = ollama.chat(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            options=opts,
-            stream=False,
-        )
-    except Exception as e:
-        logger.exception("ollama.chat failed: %s", e)
-        return {"error": "ollama_error", "exception": str(e)}
+    if fresh:
+        try:
+            resp = client.chat(
+                model=model,
+                messages=_messages(prompt, system),
+                options=opts,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                stream=False,
+            )
+        except Exception as e:
+            logger.exception("ollama.chat failed: %s", e)
+            return {"error": "ollama_error", "exception": str(e)}
 
-    content = resp.get("message", {}).get("content", "")
+        content = resp.get("message", {}).get("content", "")
     if not json_mode:
+        if fresh:
+            _cache_put(key, content)
         return content
 
-    # 1) Try direct JSON parse
-    parsed = _safe_json_load(content)
+    # 1-3) Recover JSON locally
+    parsed = _extract_json(content)
     if parsed is not None:
+        if fresh:
+            _cache_put(key, content, resp)
         return parsed
 
-    # 2) Try extracting largest {...} substring and parse
-    candidate = _extract_largest_brace_group(content)
-    if candidate:
-        parsed = _safe_json_load(candidate)
-        if parsed is not None:
-            return parsed
-
-    # 3) Ask the model to repair the JSON (few-shot / direct instruction)
+    # 4) Ask the model to repair the JSON (few-shot / direct instruction)
     # We send a compact repair prompt and include the original raw content.
-    repair_prompt_template = (
-        "The previous response was supposed to be valid JSON but it is invalid or truncated.\n"
-        "Please extract and return only the corrected, valid JSON object (no explanation, no markdown).\n"
-        "Here is the raw output that needs fixing:\n\n"
-        "<<<RAW_OUTPUT>>>\n\n"
-        "Return just valid JSON (object or array). If fields are truncated, try to complete them reasonably."
-    )
-
-    repair_prompt = repair_prompt_template.replace("<<<RAW_OUTPUT>>>", content)
-
-    # On repair attempts, increase allowed token budget (num_predict) to give model room to return full JSON
-    repair_opts = dict(opts)
-    # bump token budget a bit (caller can increase more explicitly)
-    repair_opts["num_predict"] = max(repair_opts.get("num_predict", 400), 800)
+    repair = _repair_request(content, opts)
 
     attempt = 0
     while attempt < repair_attempts:
         attempt += 1
+        fut = _REPAIR_EXECUTOR.submit(
+            client.chat,
+            model=model,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            stream=False,
+            **repair,
+        )
         try:
-            repair_resp = ollama.chat(
-                model=model,
-                messages=[{"role": "user", "content": repair_prompt}],
-                options=repair_opts,
-                stream=False,
-            )
+            repair_resp = fut.result(timeout=REPAIR_TIMEOUT if repair_timeout is None else repair_timeout)
+        except FuturesTimeout:
+            # drop the call if it's still queued; a running one can't be interrupted and
+            # finishes in the background
+            fut.cancel()
+            logger.warning("ollama.chat (repair) exceeded its time budget on attempt %d", attempt)
+            break
         except Exception as e:
             logger.exception("ollama.chat (repair) failed on attempt %d: %s", attempt, e)
             break
@@ -129,30 +397,156 @@ def ask_ollama(prompt: str, model: str, json_mode: bool = True, options: Optiona
 
         # Try parse repaired content
         parsed = _safe_json_load(repair_content)
+        if parsed is None:
+            # Try recovering (possibly truncated) JSON from repair_content
+            parsed = _complete_partial_json(repair_content)
         if parsed is not None:
+            # cache the output that parses, so a hit doesn't repeat the repair
+            _cache_put(key, repair_content, repair_resp)
             return parsed
 
-        # Try extracting {} from repair_content
-        candidate = _extract_largest_brace_group(repair_content)
-        if candidate:
-            parsed = _safe_json_load(candidate)
-            if parsed is not None:
-                return parsed
-
         # If repair attempt didn't produce valid JSON, loop and retry (up to repair_attempts)
 
-    # 4) Heuristic: try to close unmatched braces on the original output and parse
-    closed = _close_braces_heuristic(content)
-    parsed = _safe_json_load(closed)
+    # Nothing worked — return structured failure payload for downstream code to handle
+    return {"error": "Invalid JSON", "raw": content}
+
+
+def ask_ollama_stream(prompt: str, model: str, options: Optional[Dict] = None, client: Optional[ollama.Client] = None,
+                      system: Optional[str] = None, max_output_tokens: Optional[int] = None,
+                      ctx: Optional[int] = None) -> Iterator[str]:
+    """
+    Stream the model's answer as it is generated, yielding content chunks. Closing the
+    generator early closes the connection, which stops generation on the server.
+    """
+    client = client or SHARED_OLLAMA_CLIENT
+    opts = _call_options(False, options, max_output_tokens, ctx)
+    for chunk in client.chat(
+        model=model,
+        messages=_messages(prompt, system),
+        options=opts,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        stream=True,
+    ):
+        text = chunk.get("message", {}).get("content", "")
+        if text:
+            yield text
+
+def ask_ollama_stream_json(prompt: str, model: str, options: Optional[Dict] = None,
+                           client: Optional[ollama.Client] = None, system: Optional[str] = None,
+                           max_output_tokens: Optional[int] = None, ctx: Optional[int] = None) -> Any:
+    """
+    JSON-mode ask over a stream: returns as soon as the first top-level object closes
+    and parses, dropping the connection so trailing prose isn't decoded. Falls back to
+    ask_ollama's local recovery on the full text; no repair call.
+    """
+    if max_output_tokens is None:
+        max_output_tokens = JSON_MAX_OUTPUT_TOKENS
+    scanner = _ObjectScanner()
+    stream = ask_ollama_stream(prompt, model, options, client, system, max_output_tokens, ctx)
+    try:
+        for text in stream:
+            candidate = scanner.feed(text)
+            if candidate is not None:
+                parsed = _safe_json_load(candidate)
+                if parsed is not None:
+                    return parsed
+                break
+    except Exception as e:
+        logger.exception("ollama.chat (stream) failed: %s", e)
+        return {"error": "ollama_error", "exception": str(e)}
+    finally:
+        stream.close()
+
+    parsed = _extract_json(scanner.text)
+    if parsed is not None:
+        return parsed
+    return {"error": "Invalid JSON", "raw": scanner.text}
+
+@asynccontextmanager
+async def _async_client():
+    """
+    Short-lived AsyncClient for the configured server(s), closed on exit; round-robins
+    across OLLAMA_ENDPOINTS like the shared sync client.
+    """
+    clients = [ollama.AsyncClient(host=h, timeout=OLLAMA_TIMEOUT) for h in (OLLAMA_ENDPOINTS or [OLLAMA_HOST])]
+    try:
+        yield clients[0] if len(clients) == 1 else RoundRobinClient(clients)
+    finally:
+        for c in clients:
+            await c._client.aclose()
+
+async def ask_ollama_async(prompt: str, model: str, json_mode: bool = True, options: Optional[Dict] = None,
+                           client: Optional[ollama.AsyncClient] = None, repair_timeout: Optional[float] = None,
+                           max_output_tokens: Optional[int] = None, ctx: Optional[int] = None,
+                           use_cache: bool = True, system: Optional[str] = None) -> Any:
+    """
+    Async counterpart of ask_ollama (same options, JSON recovery and return values) with
+    a single repair attempt. `client` should be an ollama.AsyncClient created on the
+    running event loop; a temporary one is used if omitted.
+    """
+    if client is None:
+        async with _async_client() as client:
+            return await ask_ollama_async(prompt, model, json_mode, options, client, repair_timeout,
+                                          max_output_tokens, ctx, use_cache, system)
+
+    opts = _call_options(json_mode, options, max_output_tokens, ctx)
+    key = _cache_key(model, prompt, opts, system) if use_cache and _CACHE is not None else None
+    content = _CACHE.get(key) if key else None
+    fresh = content is None
+    if fresh:
+        try:
+            resp = await client.chat(
+                model=model,
+                messages=_messages(prompt, system),
+                options=opts,
+                keep_alive=OLLAMA_KEEP_ALIVE,
+                stream=False,
+            )
+        except Exception as e:
+            logger.exception("ollama.chat failed: %s", e)
+            return {"error": "ollama_error", "exception": str(e)}
+
+        content = resp.get("message", {}).get("content", "")
+    if not json_mode:
+        if fresh:
+            _cache_put(key, content)
+        return content
+
+    parsed = _extract_json(content)
     if parsed is not None:
+        if fresh:
+            _cache_put(key, content, resp)
         return parsed
 
-    # 5) Heuristic: try to close braces on the last candidate substring
-    if candidate:
-        candidate_closed = _close_braces_heuristic(candidate)
-        parsed = _safe_json_load(candidate_closed)
+    try:
+        repair_resp = await asyncio.wait_for(
+            client.chat(model=model, keep_alive=OLLAMA_KEEP_ALIVE, stream=False, **_repair_request(content, opts)),
+            timeout=REPAIR_TIMEOUT if repair_timeout is None else repair_timeout,
+        )
+    except asyncio.TimeoutError:
+        logger.warning("ollama.chat (repair) exceeded its time budget")
+    except Exception as e:
+        logger.exception("ollama.chat (repair) failed: %s", e)
+    else:
+        repair_content = repair_resp.get("message", {}).get("content", "")
+        parsed = _safe_json_load(repair_content)
+        if parsed is None:
+            parsed = _complete_partial_json(repair_content)
         if parsed is not None:
+            _cache_put(key, repair_content, repair_resp)
             return parsed
 
-    # Nothing worked — return structured failure payload for downstream code to handle
     return {"error": "Invalid JSON", "raw": content}
+
+async def ask_many(prompts: List[str], model: str, *, concurrency: int = 4, json_mode: bool = True,
+                   options: Optional[Dict] = None) -> List[Any]:
+    """
+    Run independent prompts concurrently, at most `concurrency` in flight (match the
+    server's OLLAMA_NUM_PARALLEL). Results are returned in prompt order.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    async with _async_client() as client:
+        async def one(p: str) -> Any:
+            async with sem:
+                return await ask_ollama_async(p, model, json_mode, options, client)
+        return await asyncio.gather(*(one(p) for p in prompts))
@@ -1,56 +1,301 @@
 from typing import List, Dict, Any
 from pathlib import Path
+from functools import lru_cache
+from collections import defaultdict, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import sys
+import queue
+import hashlib
+import threading
+import time
 import chromadb
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
+from sentence_transformers.util import batch_to_device
 import pandas as pd
-import uuid
+from tqdm import tqdm
+from utils.embed_store import EmbedStore
 
 PERSIST_DIR = str(Path(".chroma").absolute())
 _EMBEDDER = None  # Lazy-initialized
+ADD_BATCH = int(os.getenv("CHROMA_ADD_BATCH", "2000"))  # docs per embed + coll.add round
+
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# "onnx" runs the int8-quantized ONNX export of the model on CPU (needs sentence-transformers[onnx])
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+ONNX_FILE = os.getenv("EMBED_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+USE_CUDA = EMBED_BACKEND != "onnx" and torch.cuda.is_available()
+EMBED_BATCH = 64 if EMBED_BACKEND == "onnx" else (256 if USE_CUDA else 128)
+# GPU weight precision: fp32 (default), fp16 or bf16. Check cosine deltas on your data
+# before switching; outputs are always returned as float32.
+EMBED_DTYPE = os.getenv("EMBED_DTYPE", "fp32")
+_TORCH_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16}
+# Document vectors are kept here by content hash and reused on re-ingest ("" disables)
+EMBED_STORE_DIR = os.getenv("EMBED_STORE_DIR", ".embed_store")
+_EMBED_STORE = None
+TOKENIZE_PREFETCH = 2  # batches tokenized ahead of the GPU in _encode_pipelined
+# cached query vectors and the embed store are fp16 unless HIGH_PRECISION is set
+HIGH_PRECISION = os.getenv("HIGH_PRECISION", "").lower() in ("1", "true", "yes")
 
 def _get_embedder() -> SentenceTransformer:
     global _EMBEDDER
     if _EMBEDDER is None:
-        _EMBEDDER = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        if EMBED_BACKEND == "onnx":
+            _EMBEDDER = SentenceTransformer(EMBED_MODEL, device="cpu", backend="onnx",
+                                            model_kwargs={"file_name": ONNX_FILE})
+        else:
+            _EMBEDDER = SentenceTransformer(EMBED_MODEL, device="cuda" if USE_CUDA else "cpu")
+            if USE_CUDA and EMBED_DTYPE in _TORCH_DTYPES:
+                _EMBEDDER.to(_TORCH_DTYPES[EMBED_DTYPE])
     return _EMBEDDER
 
-def _embed(texts: List[str]) -> List[List[float]]:
+def _encode_pipelined(embedder: SentenceTransformer, texts: List[str]) -> np.ndarray:
+    """
+    GPU encode where the next batches are tokenized on a worker thread while the current
+    one runs on the device, so tokenization doesn't leave the GPU idle. One worker: the
+    fast tokenizer already parallelizes a batch internally and isn't safe to share.
+    """
+    batches = [texts[s:s + EMBED_BATCH] for s in range(0, len(texts), EMBED_BATCH)]
+    out = []
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="tokenize") as pool, torch.inference_mode():
+        pending = queue.Queue(maxsize=TOKENIZE_PREFETCH)
+        upcoming = iter(batches)
+        for b in upcoming:
+            pending.put(pool.submit(embedder.tokenize, b))
+            if pending.full():
+                break
+        while not pending.empty():
+            features = pending.get().result()
+            nxt = next(upcoming, None)
+            if nxt is not None:
+                pending.put(pool.submit(embedder.tokenize, nxt))
+            emb = embedder(batch_to_device(features, embedder.device))["sentence_embedding"]
+            out.append(torch.nn.functional.normalize(emb, p=2, dim=1).float().cpu().numpy())
+    return np.concatenate(out)
+
+def _embed(texts: List[str]) -> np.ndarray:
     embedder = _get_embedder()
-    return embedder.encode(texts, normalize_embeddings=True).tolist()
+    # encode in length order so each batch pads to similar lengths, then restore input order
+    order = np.argsort([len(t) for t in texts], kind="stable")
+    sorted_texts = [texts[i] for i in order]
+    # reduced-precision weights also go through the manual path, which upcasts before numpy
+    if USE_CUDA and (len(texts) > EMBED_BATCH or EMBED_DTYPE in _TORCH_DTYPES):
+        emb = _encode_pipelined(embedder, sorted_texts)
+    else:
+        emb = embedder.encode(sorted_texts, batch_size=EMBED_BATCH, normalize_embeddings=True,
+                              convert_to_numpy=True, show_progress_bar=False, device=embedder.device)
+    out = np.empty_like(emb)
+    out[order] = emb
+    return np.ascontiguousarray(out, dtype=np.float32)
+
+def _get_embed_store() -> EmbedStore:
+    global _EMBED_STORE
+    if _EMBED_STORE is None:
+        # one store per model/backend: vectors from different encoders aren't interchangeable.
+        # Vectors are kept as fp16 unless HIGH_PRECISION is set, in which case they (and
+        # what goes to Chroma) stay float32.
+        dtype = np.float32 if HIGH_PRECISION else np.float16
+        name = f"{EMBED_MODEL.replace('/', '__')}-{EMBED_BACKEND}-{np.dtype(dtype).name}"
+        _EMBED_STORE = EmbedStore(os.path.join(EMBED_STORE_DIR, name), dtype=dtype)
+    return _EMBED_STORE
+
+def _doc_embeddings(docs: List[str], shas: List[str]) -> np.ndarray:
+    """Embeddings for docs, encoding only those whose content hash isn't in the embed store."""
+    if not EMBED_STORE_DIR:
+        return _embed(docs)
+    store = _get_embed_store()
+    missing = set(store.missing(shas))
+    if missing:
+        todo = [j for j, sha in enumerate(shas) if sha in missing]
+        store.append([shas[j] for j in todo], _embed([docs[j] for j in todo]))
+    return store.get(shas).astype(np.float32)
+
+# LRU of query text -> embedding. A plain dict rather than lru_cache so a batch can
+# look every query up first and embed only the misses together.
+QUERY_CACHE_SIZE = 1024
+_QUERY_CACHE: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_QUERY_CACHE_LOCK = threading.Lock()
 
+def _embed_queries(queries: List[str]) -> np.ndarray:
+    """float32 (len(queries), D) embeddings, from the query LRU where possible."""
+    found = {}
+    with _QUERY_CACHE_LOCK:
+        for q in queries:
+            vec = _QUERY_CACHE.get(q)
+            if vec is not None:
+                _QUERY_CACHE.move_to_end(q)
+                found[q] = vec
+    misses = list(dict.fromkeys(q for q in queries if q not in found))
+    if misses:
+        embs = _embed(misses)
+        with _QUERY_CACHE_LOCK:
+            for q, vec in zip(misses, embs):
+                # own copy, read-only so the cached vector can't be mutated by callers
+                vec = vec.astype(np.float32 if HIGH_PRECISION else np.float16)
+                vec.setflags(write=False)
+                _QUERY_CACHE[q] = found[q] = vec
+                if len(_QUERY_CACHE) > QUERY_CACHE_SIZE:
+                    _QUERY_CACHE.popitem(last=False)
+    return np.stack([found[q] for q in queries]).astype(np.float32)
+
+def clear_query_cache() -> None:
+    with _QUERY_CACHE_LOCK:
+        _QUERY_CACHE.clear()
+
+@lru_cache(maxsize=1)
 def get_client():
     return chromadb.PersistentClient(path=PERSIST_DIR)
 
+# HNSW index parameters. Chroma only applies these when a collection is created, so an
+# existing collection keeps its old values until it is dropped and re-ingested.
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": int(os.getenv("CHROMA_HNSW_M", "24")),
+    "hnsw:construction_ef": int(os.getenv("CHROMA_HNSW_EF_CONSTRUCT", "128")),
+    "hnsw:search_ef": int(os.getenv("CHROMA_HNSW_EF_SEARCH", "100")),
+    "hnsw:batch_size": 200,
+    "hnsw:sync_threshold": 2000,
+}
+
+_WRITE_LOCKS: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_WRITE_LOCKS_GUARD = threading.Lock()
+
+def _write_lock(namespace: str) -> threading.Lock:
+    # reads are safe to share; writes to one collection are serialized
+    with _WRITE_LOCKS_GUARD:
+        return _WRITE_LOCKS[namespace]
+
+@lru_cache(maxsize=64)
 def get_collection(namespace: str):
     client = get_client()
-    return client.get_or_create_collection(name=namespace, metadata={"hnsw:space": "cosine"})
+    return client.get_or_create_collection(name=namespace, metadata=HNSW_METADATA)
 
 def upsert_dataframe_as_docs(df: pd.DataFrame, namespace: str, text_cols: List[str], meta_cols: List[str] = None, id_prefix: str = ""):
     meta_cols = meta_cols or []
     coll = get_collection(namespace)
-    docs, ids, metas = [], [], []
-    for i, row in df.iterrows():
-        text = " | ".join(str(row[c]) for c in text_cols if pd.notna(row[c]))
-        doc_id = f"{id_prefix}{i}-{uuid.uuid4().hex[:8]}"
-        meta = {k: (None if pd.isna(row[k]) else row[k]) for k in meta_cols}
-        ids.append(doc_id)
-        docs.append(text)
-        metas.append(meta)
+    # column-wise conversion; only the final join runs per row
+    present = df[text_cols].notna().to_numpy()
+    values = df[text_cols].astype(str).to_numpy()
+    docs = [" | ".join(v[m]) for v, m in zip(values, present)]
+    if meta_cols:
+        metas = df[meta_cols].astype(object).where(df[meta_cols].notna(), None).to_dict("records")
+    else:
+        # to_dict("records") on a frame with no columns returns [], not one {} per row
+        metas = [{} for _ in range(len(df))]
+    # one urandom draw for every row's 4-byte suffix instead of a uuid4() per row
+    rand = os.urandom(4 * len(df)).hex()
+    ids = [f"{id_prefix}{i}-{rand[8 * n:8 * n + 8]}" for n, i in enumerate(df.index)]
 
-    coll.add(documents=docs, metadatas=metas, ids=ids, embeddings=_embed(docs))
+    # row hash over the doc text and its metadata, stored in metadata so re-ingesting
+    # overlapping data skips rows that are already in the collection (and repeats within
+    # this frame). Embeddings are keyed by the text alone, so rows that differ only in
+    # metadata share one stored vector.
+    first = {}
+    text_shas = []
+    for j, text in enumerate(docs):
+        text_shas.append(hashlib.blake2b(text.encode(), digest_size=16).hexdigest())
+        meta_key = "\x1f".join(f"{k}={v}" for k, v in sorted(metas[j].items()))
+        sha = hashlib.blake2b(f"{text}\x1e{meta_key}".encode(), digest_size=16).hexdigest()
+        metas[j]["sha"] = sha
+        first.setdefault(sha, j)
+    if len(first) < len(docs):
+        keep = sorted(first.values())
+        docs = [docs[j] for j in keep]
+        metas = [metas[j] for j in keep]
+        ids = [ids[j] for j in keep]
+        text_shas = [text_shas[j] for j in keep]
+
+    # embed and insert one batch at a time: avoids a single huge coll.add and keeps only
+    # one batch of embeddings in memory
+    starts = range(0, len(docs), ADD_BATCH)
+    if sys.stderr.isatty():
+        starts = tqdm(starts, desc=f"Adding {namespace}")
+    with _write_lock(namespace):
+        for s in starts:
+            e = s + ADD_BATCH
+            shas = [m["sha"] for m in metas[s:e]]
+            stored = coll.get(where={"sha": {"$in": shas}}, include=["metadatas"])["metadatas"]
+            seen = {m["sha"] for m in stored if m}
+            new = [j for j in range(s, min(e, len(docs))) if metas[j]["sha"] not in seen]
+            if not new:
+                continue
+            new_docs = [docs[j] for j in new]
+            coll.add(documents=new_docs, metadatas=[metas[j] for j in new], ids=[ids[j] for j in new],
+                     embeddings=_doc_embeddings(new_docs, [text_shas[j] for j in new]))
+
+def _hits(res: Dict[str, Any], j: int) -> List[Dict[str, Any]]:
+    """Rows for the j-th query embedding of a coll.query result."""
+    ids = res["ids"][j]
+    dists = res.get("distances")
+    dists = dists[j] if dists else [None] * len(ids)
+    return [{"id": i, "text": d, "metadata": m, "distance": dist}
+            for i, d, m, dist in zip(ids, res["documents"][j], res["metadatas"][j], dists)]
+
+class QueryBatcher:
+    """
+    Coalesces concurrent query_namespace calls: requests arriving within max_wait of each
+    other (up to max_batch) share one embed pass and one coll.query per (namespace, k).
+    """
+
+    def __init__(self, max_batch: int = 16, max_wait: float = 0.005):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, namespace: str, query: str, k: int) -> Future:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+                    self._thread.start()
+        fut: Future = Future()
+        self._queue.put((namespace, query, k, fut))
+        return fut
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        groups = defaultdict(list)
+        for namespace, query, k, fut in batch:
+            groups[(namespace, k)].append((query, fut))
+        for (namespace, k), items in groups.items():
+            try:
+                queries = list(dict.fromkeys(q for q, _ in items))
+                # cached queries skip the encoder; the misses are embedded in one pass
+                embs = _embed_queries(queries)
+                res = get_collection(namespace).query(query_embeddings=embs, n_results=k)
+                pos = {q: j for j, q in enumerate(queries)}
+                for q, fut in items:
+                    fut.set_result(_hits(res, pos[q]))
+            except Exception as e:
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+_BATCHER = QueryBatcher()
 
 def query_namespace(namespace: str, query: str, k: int = 5) -> List[Dict[str, Any]]:
-    coll = get_collection(namespace)
-    res = coll.query(
-        query_embeddings=_embed([query]),
-        n_results=k
-    )
-    out = []
-    for i in range(len(res["ids"][0])):
-        out.append({
-            "id": res["ids"][0][i],
-            "text": res["documents"][0][i],
-            "metadata": res["metadatas"][0][i],
-            "distance": res["distances"][0][i] if "distances" in res else None
-        })
-    return out
+    return _BATCHER.submit(namespace, query, k).result()
+
+def query_namespace_many(namespace: str, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
+    """Run several queries against one namespace in a single coll.query; one result list per query."""
+    if not queries:
+        return []
+    res = get_collection(namespace).query(query_embeddings=_embed_queries(queries), n_results=k)
+    return [_hits(res, j) for j in range(len(queries))]